@@ -0,0 +1,310 @@
+from recipe import Recipe
+
+class _Node:
+    '''
+    Node of the compressed trie. label is the text on the edge leading into
+    this node, count is the popularity of the term ending here (0 if no term
+    ends here), and top is the node's precomputed list of (-count, term)
+    completions, best first.
+    '''
+    __slots__ = ('label', 'children', 'count', 'term', 'top')
+
+    def __init__(self, label=''):
+        self.label = label
+        self.children = {}
+        self.count = 0
+        self.term = None
+        self.top = []
+
+
+class AutocompleteIndex:
+    '''
+    Suggests completions for text typed in the search bar, from the titles,
+    tags and ingredient names in a cookbook.
+
+    Terms are stored in a compressed prefix trie (each edge can hold several
+    characters), keyed by their lowercased text. Each term's popularity is
+    the number of recipes it appears in, and every node keeps the k most
+    popular terms below it, so looking up completions only has to walk down
+    the prefix. The stored lists are updated along the changed term's path
+    whenever a term is added or removed.
+
+    Attributes:
+        k (int): number of completions kept at each node
+    '''
+    def __init__(self, k=8):
+        self.k = k
+        self._root = _Node()
+
+    @staticmethod
+    def recipe_terms(recipe):
+        '''
+        Returns the list of terms a recipe contributes: its title, tags and
+        (normalised) ingredient names. Terms are keyed by their lowercased
+        text, so each one is only counted once per recipe; if it is written
+        more than one way, the spelling in the title is used, then the tags,
+        then the ingredients.
+        '''
+        names = [recipe.title] + list(recipe.tags)
+        names += [Recipe.normalise_name(ing[2]) for ing in recipe.ingredients]
+        terms = {}
+        for name in names:
+            term = ' '.join(name.split()) if name else ''
+            if term:
+                terms.setdefault(term.lower(), term)
+        return list(terms.values())
+
+    def add_recipe(self, recipe):
+        '''
+        Adds one to the popularity of each of a recipe's terms.
+        '''
+        for term in AutocompleteIndex.recipe_terms(recipe):
+            self.add(term)
+
+    def remove_recipe(self, recipe):
+        '''
+        Takes one off the popularity of each of a recipe's terms. The recipe
+        should have the same terms as when it was added.
+        '''
+        for term in AutocompleteIndex.recipe_terms(recipe):
+            self.add(term, -1)
+
+    def build(self, recipes):
+        '''
+        Replaces the contents of the index with the terms of a list of
+        recipes. This gives the same index as calling add_recipe() for each
+        recipe, but is much faster for a whole cookbook: the terms are counted
+        first, put into the trie without any completion lists, and then every
+        node's list is filled in once, from the bottom of the trie up.
+        '''
+        # maps each lowercased term to [popularity, term as first written]
+        counts = {}
+        for recipe in recipes:
+            for term in AutocompleteIndex.recipe_terms(recipe):
+                entry = counts.get(term.lower())
+                if entry is None:
+                    counts[term.lower()] = [1, term]
+                else:
+                    entry[0] += 1
+
+        self._root = _Node()
+        for key, (popularity, term) in counts.items():
+            node = self._path(key, create=True)[-1]
+            node.count = popularity
+            node.term = term
+
+        # children's lists have to be filled in before their parent's
+        stack = [(self._root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+                continue
+            top = [(-node.count, node.term)] if node.count else []
+            for child in node.children.values():
+                top += child.top
+            top.sort()
+            node.top = top[:self.k]
+
+    def add(self, term, delta=1):
+        '''
+        Changes the popularity of a term by delta, adding it to the trie if it
+        is new and removing it once its popularity reaches zero.
+        '''
+        path = self._path(term.lower(), create=delta > 0)
+        if path is None:
+            return
+        node = path[-1]
+
+        old_count = node.count
+        node.count = max(node.count + delta, 0)
+        if node.term is None or node.count == 0:
+            node.term = term if node.count else None
+        if node.count == old_count:
+            return
+
+        if node.count > old_count:
+            self._raise_term(path, node)
+        else:
+            self._lower_term(path)
+
+    def complete(self, prefix, k=None):
+        '''
+        Returns up to k of the most popular terms starting with prefix
+        (ignoring case), most popular first.
+        '''
+        node = self._root
+        rest = prefix.lower()
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                return []
+            common = _common_prefix_length(child.label, rest)
+            if common < len(rest) and common < len(child.label):
+                return []
+            rest = rest[common:]
+            node = child
+        return [entry[1] for entry in node.top[:k or self.k]]
+
+    def _path(self, key, create):
+        # returns the list of nodes from the root to the node for key. if
+        # create is False and key isn't in the trie, returns None instead of
+        # adding it.
+        path = [self._root]
+        node = self._root
+        rest = key
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                if not create:
+                    return None
+                child = _Node(rest)
+                node.children[rest[0]] = child
+            else:
+                common = _common_prefix_length(child.label, rest)
+                if common < len(child.label):
+                    if not create:
+                        return None
+                    child = self._split(node, child, common)
+            rest = rest[len(child.label):]
+            node = child
+            path.append(node)
+        return path
+
+    def _split(self, parent, child, length):
+        # splits child's edge after length characters, putting a new node in
+        # between which has the same completions as child
+        middle = _Node(child.label[:length])
+        middle.top = list(child.top)
+        child.label = child.label[length:]
+        middle.children[child.label[0]] = child
+        parent.children[middle.label[0]] = middle
+        return middle
+
+    def _raise_term(self, path, node):
+        # the term's popularity went up, so it can only move up (or into)
+        # each list of completions on its path
+        # a node's term keeps the same spelling for as long as it is in the
+        # trie, so its old entries can be found by comparing terms directly
+        entry = (-node.count, node.term)
+        for n in path:
+            top = n.top
+            for i, e in enumerate(top):
+                if e[1] == node.term:
+                    del top[i]
+                    break
+            else:
+                if len(top) >= self.k and entry > top[-1]:
+                    # the list is full of more popular terms already
+                    continue
+            top.append(entry)
+            top.sort()
+            del top[self.k:]
+
+    def _lower_term(self, path):
+        # the term's popularity went down, so something from further down the
+        # trie may need to take its place. rebuild the lists from the bottom
+        # of the path up, from each node's children.
+        for depth in range(len(path) - 1, -1, -1):
+            n = path[depth]
+            if depth > 0 and n.count == 0 and not n.children:
+                del path[depth - 1].children[n.label[0]]
+                continue
+            if depth > 0 and n.count == 0 and len(n.children) == 1:
+                # merge a node that no longer does anything into its child
+                (child,) = n.children.values()
+                child.label = n.label + child.label
+                path[depth - 1].children[child.label[0]] = child
+                continue
+
+            top = [(-n.count, n.term)] if n.count else []
+            for child in n.children.values():
+                top += child.top
+            top.sort()
+            n.top = top[:self.k]
+
+
+def _common_prefix_length(a, b):
+    length = 0
+    for char_a, char_b in zip(a, b):
+        if char_a != char_b:
+            break
+        length += 1
+    return length
+
+
+if __name__ == '__main__':
+    # checks the trie against working out the completions by brute force,
+    # after building it all at once and one recipe at a time, and after
+    # random recipes are added and removed
+    import random
+
+    def random_recipe():
+        words = ['to', 'tom', 'tomato', 'Tomato', 'pie', 'pi', 'p', 'pear',
+            'peach', 'apple', 'app', 'soup', 'so']
+        title = ' '.join(random.sample(words, random.randint(1, 3)))
+        ingredients = '\n'.join(f'1 cup {w}' for w in
+            random.sample(words, random.randint(0, 4)))
+        tags = random.sample(words, random.randint(0, 2))
+        return Recipe(title, ingredients, '', tags=tags)
+
+    def count_terms(counts, recipe, delta):
+        # worked out separately from recipe_terms, so that mistakes in it are
+        # caught: a recipe counts once towards each term whatever case it is
+        # written in, with the spelling from its title, then its tags, then
+        # its ingredients. a term keeps the spelling it was first added with
+        # for as long as any recipe has it, like in the trie.
+        spellings = {}
+        for name in reversed([recipe.title] + recipe.tags + [
+                Recipe.normalise_name(ing[2]) for ing in recipe.ingredients]):
+            if name.strip():
+                spellings[name.lower()] = name
+        for key, term in spellings.items():
+            entry = counts.setdefault(key, [0, term])
+            entry[0] += delta
+            if entry[0] == 0:
+                del counts[key]
+
+    def brute_force(counts, prefix, k):
+        found = sorted((-n, term) for key, (n, term) in counts.items()
+            if key.startswith(prefix.lower()))
+        return [term for _, term in found[:k]]
+
+    # a recipe with the same term in its title and an ingredient counts once
+    index = AutocompleteIndex()
+    index.build([Recipe('Pasta', '1 lb pasta', ''), Recipe('pear', '', ''),
+        Recipe('Pear', '', '')])
+    assert index.complete('p') == ['pear', 'Pasta'], index.complete('p')
+
+    random.seed(0)
+    for trial in range(200):
+        recipes = [random_recipe() for _ in range(random.randint(0, 30))]
+        counts = {}
+        for recipe in recipes:
+            count_terms(counts, recipe, 1)
+        built = AutocompleteIndex(k=4)
+        built.build(recipes)
+        added = AutocompleteIndex(k=4)
+        for recipe in recipes:
+            added.add_recipe(recipe)
+
+        for step in range(20):
+            if recipes and random.random() < 0.5:
+                recipe = recipes.pop(random.randrange(len(recipes)))
+                count_terms(counts, recipe, -1)
+                built.remove_recipe(recipe)
+                added.remove_recipe(recipe)
+            else:
+                recipe = random_recipe()
+                recipes.append(recipe)
+                count_terms(counts, recipe, 1)
+                built.add_recipe(recipe)
+                added.add_recipe(recipe)
+
+            for prefix in ['', 't', 'To', 'tomato', 'p', 'pe', 'app', 'x',
+                    'tomato pie', 'so']:
+                expected = brute_force(counts, prefix, 4)
+                assert built.complete(prefix) == expected, (prefix, expected)
+                assert added.complete(prefix) == expected, (prefix, expected)
+    print('autocomplete index matches brute force')
@@ -0,0 +1,167 @@
+import logging
+import queue
+import threading
+import time
+
+class AutoSaver:
+    '''
+    Saves changes to a Cookbook in a background thread, so that edits are
+    written to disk soon after they are made without the GUI ever waiting on
+    disk access.
+
+    The AutoSaver subscribes to the cookbook's change notifications and puts
+    each change on a queue. The background thread waits until delay seconds
+    after the first change it sees, collecting any further changes in that
+    time, then writes them all to the cookbook's storage at once. Changes to
+    the same recipe are combined, so a recipe edited several times within the
+    delay is only written once.
+
+    Changes that fail to be written (i.e. because the disk is full) are kept,
+    and tried again with the next batch, after retry_delay seconds if nothing
+    else changes before then, and when the AutoSaver is closed. A newer change
+    to the same recipe replaces a failed one.
+
+    Attributes:
+        cookbook (Cookbook): cookbook to save
+        delay (float): seconds to wait after a change before writing it
+        retry_delay (float): seconds to wait before trying failed changes
+            again
+    '''
+    # put on the queue to tell the thread to finish
+    _STOP = object()
+
+    def __init__(self, cookbook, delay=2.0, retry_delay=30.0):
+        self.cookbook = cookbook
+        self.delay = delay
+        self.retry_delay = retry_delay
+
+        self._queue = queue.Queue()
+        # changes which couldn't be written, by title. only used by the
+        # background thread (and by close(), once the thread has finished)
+        self._failed = {}
+        self._thread = threading.Thread(target=self._run,
+            name='recipe-autosave', daemon=True)
+
+        cookbook.defer_writes = True
+        cookbook.subscribe(self._on_change)
+        self._thread.start()
+
+    def save(self, title):
+        '''
+        Queues a recipe in the cookbook to be saved, even though it hasn't
+        changed (i.e. to move it into a new storage layout).
+        '''
+        recipe = self.cookbook.find_by_title(title)
+        if recipe:
+            self._queue.put(('save', title, recipe))
+
+    def close(self):
+        '''
+        Writes any changes that are still waiting, without waiting for the
+        delay, then stops the background thread. Blocks until it is done.
+
+        Returns:
+            unsaved (list): titles of the recipes whose changes still couldn't
+                be written, even after trying again
+        '''
+        self._queue.put(AutoSaver._STOP)
+        self._thread.join()
+        return sorted(self._failed)
+
+    def _on_change(self, kind, title, recipe):
+        self._queue.put((kind, title, recipe))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                # if some changes failed, try them again after a while even
+                # if nothing else changes
+                change = self._queue.get(
+                    timeout=self.retry_delay if self._failed else None)
+            except queue.Empty:
+                change = None
+
+            # pending maps each title to its latest (kind, title, recipe), so
+            # repeated changes to the same recipe are only written once.
+            # changes that failed last time are tried again, unless there is
+            # a newer change to the same recipe.
+            pending = self._failed
+            self._failed = {}
+            if change is AutoSaver._STOP:
+                stopping = True
+            elif change is not None:
+                pending[change[1]] = change
+
+            deadline = time.monotonic() + self.delay
+            while change is not None and not stopping:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        change = self._queue.get(timeout=timeout)
+                    else:
+                        change = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if change is AutoSaver._STOP:
+                    # write whatever is left straight away
+                    stopping = True
+                    break
+                pending[change[1]] = change
+
+            if pending:
+                self._failed = self._write(pending)
+
+    def _write(self, pending):
+        '''
+        Writes a batch of changes to storage.
+
+        Args:
+            pending (dict): maps titles to (kind, title, recipe) changes
+
+        Returns:
+            failed (dict): the changes which couldn't be written, in the same
+                format
+        '''
+        storage = self.cookbook.storage
+        failed = {}
+        to_save = []
+        for kind, title, recipe in pending.values():
+            if kind == 'delete':
+                try:
+                    storage.delete(title)
+                except Exception:
+                    logging.exception(f"Autosave could not delete {title}")
+                    failed[title] = (kind, title, recipe)
+            else:
+                to_save.append(recipe)
+
+        # versions of the recipes before they are written; if one changes
+        # while it is being written, it still counts as unsaved
+        versions = [(recipe, recipe.version) for recipe in to_save]
+        if to_save:
+            try:
+                storage.save_many(to_save)
+            except Exception:
+                # save them one at a time, so that one bad recipe doesn't
+                # stop the rest from being saved
+                logging.exception("Autosave could not save recipes, trying "
+                    "them one at a time")
+                for recipe in to_save:
+                    try:
+                        storage.save_many([recipe])
+                    except Exception:
+                        logging.exception(
+                            f"Autosave could not save {recipe.title}")
+                        failed[recipe.title] = ('save', recipe.title, recipe)
+
+        for recipe, version in versions:
+            if recipe.title not in failed:
+                self.cookbook.mark_saved(recipe, version)
+
+        if failed:
+            logging.warning(f"Autosave will try {len(failed)} change(s) again")
+        if len(failed) < len(pending):
+            logging.info(f"Autosaved {len(pending) - len(failed)} change(s)")
+        return failed
@@ -1,5 +1,13 @@
 from recipe import Recipe
-import os
+from tag_index import TagIndex
+from ingredient_index import IngredientIndex
+from history_index import HistoryIndex
+from similarity import SimilarityIndex
+from autocomplete import AutocompleteIndex
+from storage import TextFileStorage
+from datetime import datetime, timedelta
+from itertools import count
+import threading
 
 class Cookbook:
     '''
@@ -8,9 +16,55 @@ class Cookbook:
     Attributes:
         recipes (list): list of Recipe objects holding all of the recipes in
             the cookbook
+        tag_index (TagIndex): index of which recipes have each tag
+        ingredient_index (IngredientIndex): index of which recipes use each
+            ingredient
+        history (HistoryIndex): index of the dates in each recipe's notes,
+            i.e. when it was cooked
+        autocomplete (AutocompleteIndex): index of the titles, tags and
+            ingredient names, for suggesting completions of searches
+        storage (TextFileStorage or SQLiteStorage): where the recipes are
+            saved. See storage.py.
+        defer_writes (bool): if True, deleting a recipe doesn't delete it
+            from storage straight away, and it is left to a listener (like an
+            AutoSaver, see autosave.py) to do it
     '''
-    def __init__(self):
+    def __init__(self, storage=None):
         self.recipes = []
+        if storage is None:
+            storage = TextFileStorage()
+        self.storage = storage
+        self.defer_writes = False
+
+        # functions which are called after every change to the cookbook, see
+        # subscribe()
+        self._listeners = []
+
+        self.tag_index = TagIndex()
+        self.ingredient_index = IngredientIndex()
+        self.history = HistoryIndex()
+        self.autocomplete = AutocompleteIndex()
+
+        # the similarity index is slow to build, so it isn't built until the
+        # first time it is needed, or a little at a time with
+        # build_similarity_index(). after that it is kept up to date.
+        # _similarity_todo holds the ids of the recipes not added to it yet.
+        self._similarity = None
+        self._similarity_todo = []
+
+        # every recipe gets an integer id when it is added, which the indexes
+        # use to refer to it. ids are never reused.
+        self._next_id = count()
+        self._ids = {}
+        self._recipes_by_id = {}
+        self._recipes_by_title = {}
+
+        # recipes which have changed since they were last saved, by title, so
+        # that searches handled by the storage (which doesn't have the
+        # changes yet) can check these recipes themselves. locked, since
+        # recipes are marked saved from the autosave thread.
+        self._unsaved = {}
+        self._unsaved_lock = threading.Lock()
 
     def __str__(self):
         return '\n'.join([r.title for r in self.recipes])
@@ -18,49 +72,386 @@ class Cookbook:
     def find(self, fil):
         '''
         Searches the recipes for a filter string, and returns a list of recipes
-        that match the filter. Matches the filter in the title, recipe
-        instructions 
+        that match the filter. Matches the filter in the title, ingredient
+        names and tags, ignoring case.
+
+        If the storage has a search index which can search for the filter
+        (like SQLiteStorage, for filters of 3 or more characters), it is used
+        to find the matching saved recipes, and only the recipes with unsaved
+        changes are checked here. Otherwise every recipe is checked.
 
         Args:
             fil (str): filter string to search for
 
         Returns:
-            found (list): list of Recipe objects which match the filter string
+            found (list): list of Recipe objects which match the filter
+                string, in the order they were added to the cookbook
         '''
         fil = fil.lower()
-        found = []
+        search = getattr(self.storage, 'search', None)
+        # the unsaved recipes are copied before searching, so that none are
+        # missed if the autosave thread saves them part way through
+        with self._unsaved_lock:
+            unsaved = dict(self._unsaved)
+        titles = search(fil) if search is not None and fil else None
+        if titles is None:
+            return [rec for rec in self.recipes if Cookbook._matches(rec, fil)]
 
-        for rec in self.recipes:
-            # search recipes by title, ingredient, or tag
-            if fil in rec.title.lower():
-                found.append(rec)
-                continue
-            if fil in '\t'.join(rec.tags):
+        found = [rec for rec in unsaved.values() if Cookbook._matches(rec, fil)]
+        for title in titles:
+            # the storage may still have deleted or changed recipes which
+            # haven't been written yet; those are handled above
+            rec = self._recipes_by_title.get(title)
+            if rec is not None and title not in unsaved:
                 found.append(rec)
-                continue
+        return sorted(set(found), key=self._ids.get)
+
+    @staticmethod
+    def _matches(recipe, fil):
+        # whether a recipe's title, tags or ingredient names contain fil,
+        # which must be lowercase
+        if fil in recipe.title.lower():
+            return True
+        if fil in '\t'.join(recipe.tags).lower():
+            return True
+        for ing in recipe.ingredients:
+            if fil in ing[2].lower():
+                return True
+        return False
+
+    def complete(self, prefix, k=8):
+        '''
+        Suggests up to k titles, tags or ingredient names starting with prefix
+        (ignoring case), in order of how many recipes they appear in.
+        '''
+        return self.autocomplete.complete(prefix, k=k)
+
+    def find_by_tags(self, query):
+        '''
+        Finds the recipes matching a tag query, like
+        "dinner AND vegetarian NOT spicy". See TagIndex.query for the query
+        syntax.
+
+        Args:
+            query (str): tag query to evaluate
+
+        Returns:
+            found (list): list of matching Recipe objects, in the order they
+                were added to the cookbook
+        '''
+        bits = self.tag_index.query(query)
+        return [self._recipes_by_id[i] for i in TagIndex.ids(bits)]
+
+    def tag_counts(self):
+        '''
+        Returns a dictionary mapping each tag (lowercased) to the number of
+        recipes in the cookbook with that tag.
+        '''
+        return dict(self.tag_index.counts)
+
+    def what_can_i_cook(self, pantry, max_missing=0):
+        '''
+        Finds recipes that can be made (or nearly made) with the ingredients
+        in a pantry. Ingredient names are matched after normalising them with
+        Recipe.normalise_name, so "Tomatoes" in the pantry matches "tomato" in
+        a recipe.
+
+        Args:
+            pantry (iterable): names of the ingredients that are available
+            max_missing (int): largest number of ingredients a recipe can be
+                missing and still be returned. With the default of 0, only
+                recipes that can be fully made are returned.
+
+        Returns:
+            found (list): list of (recipe, missing) tuples, where missing is
+                the set of the recipe's (normalised) ingredient names that are
+                not in the pantry. Recipes that can be fully made come first,
+                and the rest are ranked by how few ingredients they are
+                missing.
+        '''
+        matches = self.ingredient_index.match(pantry, max_missing=max_missing)
+        return [(self._recipes_by_id[m[0]], m[2]) for m in matches]
+
+    def recipes_using(self, ingredients):
+        '''
+        Finds recipes which use any of a set of ingredients, like the ones in
+        a Pantry which are about to go off (see pantry.py).
+
+        Args:
+            ingredients (iterable): ingredient names to look for
+
+        Returns:
+            found (list): list of (recipe, used) tuples, where used is the set
+                of the (normalised) ingredient names the recipe uses. Recipes
+                using the most of the ingredients come first.
+        '''
+        matches = self.ingredient_index.using(ingredients)
+        return [(self._recipes_by_id[m[0]], m[1]) for m in matches]
+
+    def last_cooked(self, recipe):
+        '''
+        Returns the date of the latest note on a recipe, or None if it has
+        never been cooked.
+        '''
+        return self.history.last_cooked.get(self._ids[recipe])
+
+    def cooked_between(self, start, end):
+        '''
+        Finds every time a recipe was cooked between two dates.
+
+        Args:
+            start (datetime): earliest date to include
+            end (datetime): latest date to include
+
+        Returns:
+            cooked (list): list of (date, recipe, note text) tuples, sorted by
+                date
+        '''
+        return [(e[0], self._recipes_by_id[e[1]], e[2])
+            for e in self.history.between(start, end)]
+
+    def not_cooked_in_last(self, days, now=None):
+        '''
+        Finds the recipes that haven't been cooked in the last given number of
+        days, least recently cooked first, followed by recipes that have never
+        been cooked.
+
+        Args:
+            days (int): number of days to look back
+            now (datetime or None): date to count back from. Defaults to the
+                current time.
+        '''
+        if now is None:
+            now = datetime.now()
+        ids = self.history.not_cooked_since(now - timedelta(days=days))
+        return [self._recipes_by_id[i] for i in ids]
+
+    def most_cooked(self, start=None, end=None, n=10):
+        '''
+        Finds the recipes cooked the most times between two dates.
+
+        Args:
+            start (datetime or None): earliest date to include. Defaults to
+                the start of the current year.
+            end (datetime or None): latest date to include. Defaults to the
+                current time.
+            n (int): maximum number of recipes to return
+
+        Returns:
+            found (list): list of (recipe, times_cooked) tuples, most cooked
+                first
+        '''
+        if end is None:
+            end = datetime.now()
+        if start is None:
+            start = datetime(end.year, 1, 1)
+        return [(self._recipes_by_id[i], times)
+            for i, times in self.history.most_cooked(start, end, n=n)]
+
+    def sort_by_last_cooked(self, recipes):
+        '''
+        Returns a list of the given recipes sorted with the most recently
+        cooked first. Recipes that have never been cooked go at the end, in
+        the order they were given.
+        '''
+        ids = {self._ids[rec] for rec in recipes}
+        ordered = [self._recipes_by_id[e[1]]
+            for e in reversed(self.history.by_last_cooked) if e[1] in ids]
+        ordered += [rec for rec in recipes
+            if self._ids[rec] in self.history.uncooked]
+        return ordered
+
+    def find_similar(self, recipe, threshold=0.5):
+        '''
+        Finds the recipes in the cookbook that are similar to a recipe, based
+        on their ingredients and instructions. The recipe doesn't need to be
+        in the cookbook itself; if it is, it is left out of the results.
+
+        Args:
+            recipe (Recipe): recipe to compare against
+            threshold (float): smallest estimated similarity (the Jaccard
+                similarity of the recipes' ingredients and instruction
+                phrases) to return, from 0 to 1
 
-            for ing in rec.ingredients:
-                if fil in ing[2].lower():
-                    found.append(rec)
-                    break
+        Returns:
+            found (list): list of (recipe, similarity) tuples, most similar
+                first
+        '''
+        similarity = self._similarity_index()
+        if recipe in self._ids and self._ids[recipe] in similarity.signatures:
+            signature = similarity.signatures[self._ids[recipe]]
+        else:
+            signature = similarity.signature(recipe)
+
+        return [(self._recipes_by_id[i], sim)
+            for i, sim in similarity.similar(signature, threshold=threshold)
+            if self._recipes_by_id[i] is not recipe]
+
+    def duplicate_report(self, threshold=0.8):
+        '''
+        Finds all of the pairs of recipes in the cookbook which are likely to
+        be duplicates of each other.
+
+        Args:
+            threshold (float): smallest estimated similarity for a pair to be
+                reported, from 0 to 1
+
+        Returns:
+            duplicates (list): list of (recipe, recipe, similarity) tuples,
+                most similar first
+        '''
+        return [(self._recipes_by_id[a], self._recipes_by_id[b], sim)
+            for a, b, sim in self._similarity_index().duplicate_pairs(threshold)]
+
+    @property
+    def similarity_ready(self):
+        '''
+        Whether the similarity index (used by find_similar and
+        duplicate_report) has been built, so that using it won't have to wait
+        for it to be built first.
+        '''
+        return self._similarity is not None and not self._similarity_todo
+
+    def build_similarity_index(self, batch_size=None):
+        '''
+        Builds the similarity index, or part of it. Building it for a large
+        cookbook takes a while, so it can be built a batch of recipes at a
+        time (i.e. while the GUI is idle). Recipes that are added, changed or
+        deleted part way through are kept up to date as usual.
+
+        Args:
+            batch_size (int): most recipes to add to the index, or None to
+                finish building it
 
-        return found
+        Returns:
+            ready (bool): whether the index is finished
+        '''
+        if self._similarity is None:
+            self._similarity = SimilarityIndex()
+            self._similarity_todo = [self._ids[rec] for rec in reversed(self.recipes)]
+
+        todo = self._similarity_todo
+        done = 0
+        while todo and (batch_size is None or done < batch_size):
+            recipe_id = todo.pop()
+            # skip recipes deleted since the build started, or already added
+            # because they were changed since then
+            recipe = self._recipes_by_id.get(recipe_id)
+            if recipe is None or recipe_id in self._similarity.signatures:
+                continue
+            self._similarity.add(recipe_id, recipe)
+            done += 1
+        return not todo
+
+    def _similarity_index(self):
+        self.build_similarity_index()
+        return self._similarity
 
     def find_by_title(self, title):
-        for rec in self.recipes:
-            if rec.title==title:
-                return rec
-        return None
+        return self._recipes_by_title.get(title)
 
     def add_recipe(self, recipe):
+        self._register(recipe)
+        self._notify('save', recipe.title, recipe)
+
+    def _register(self, recipe, autocomplete=True):
+        '''
+        Gives a new recipe an id and adds it to the cookbook and its indexes.
+        If autocomplete is False, it is left out of the autocomplete index
+        (i.e. because that index is about to be built all at once).
+        '''
         self.recipes.append(recipe)
 
+        recipe_id = next(self._next_id)
+        self._ids[recipe] = recipe_id
+        self._recipes_by_id[recipe_id] = recipe
+        self._recipes_by_title.setdefault(recipe.title, recipe)
+        self._index_recipe(recipe, autocomplete=autocomplete)
+
     def delete_recipe(self, title):
         rec_to_delete = self.find_by_title(title)
-        file_to_delete = rec_to_delete.get_filename()
         self.recipes.remove(rec_to_delete)
-        # remove text file containing this recipe
-        os.remove(file_to_delete)
+
+        self._unindex_recipe(rec_to_delete)
+        del self._recipes_by_id[self._ids.pop(rec_to_delete)]
+        del self._recipes_by_title[title]
+        with self._unsaved_lock:
+            self._unsaved.pop(title, None)
+        # if there was another recipe with the same title, it can be found by
+        # its title now
+        for rec in self.recipes:
+            if rec.title == title:
+                self._recipes_by_title[title] = rec
+                break
+
+        if not self.defer_writes:
+            self.storage.delete(title)
+        self._notify('delete', title, None)
+
+    def subscribe(self, listener):
+        '''
+        Registers a function to be called after every change to the cookbook.
+        It is called as listener(kind, title, recipe), where kind is 'save'
+        if the recipe with that title was added or modified, or 'delete' if
+        it was deleted (and then recipe is None).
+        '''
+        self._listeners.append(listener)
+
+    def _notify(self, kind, title, recipe):
+        if kind == 'save':
+            with self._unsaved_lock:
+                self._unsaved[title] = recipe
+        for listener in self._listeners:
+            listener(kind, title, recipe)
+
+    def save_recipe(self, recipe):
+        '''
+        Saves one recipe to the cookbook's storage.
+        '''
+        version = recipe.version
+        self.storage.save(recipe)
+        self.mark_saved(recipe, version)
+
+    def save(self):
+        '''
+        Saves all of the recipes in the cookbook to its storage.
+        '''
+        versions = [(rec, rec.version) for rec in self.recipes]
+        self.storage.save_many(self.recipes)
+        for rec, version in versions:
+            self.mark_saved(rec, version)
+
+    def mark_saved(self, recipe, version):
+        '''
+        Records that a recipe has been written to storage, as it was at a
+        given version (see Recipe.version). Anything that saves recipes
+        without going through the cookbook (like an AutoSaver) should call
+        this afterwards. If the recipe has changed again since then, it is
+        still treated as unsaved.
+        '''
+        with self._unsaved_lock:
+            if (self._unsaved.get(recipe.title) is recipe
+                    and recipe.version == version):
+                del self._unsaved[recipe.title]
+
+    def add_note(self, title, text, date=None):
+        '''
+        Adds a cook's note to a recipe, which also records that the recipe was
+        cooked on that date.
+
+        Args:
+            title (str): title of the recipe to add the note to
+            text (str): text of the note
+            date (datetime or None): date of the note. Defaults to today.
+        '''
+        if date is None:
+            date = datetime.combine(datetime.now().date(), datetime.min.time())
+        rec = self.find_by_title(title)
+        note = (date, text)
+        rec.notes.append(note)
+        rec.mark_changed()
+        self.history.add_note(self._ids[rec], note)
+        self._notify('save', title, rec)
 
     def add(self, title, ingredients, instructions, tags=None):
         '''
@@ -69,7 +460,7 @@ class Cookbook:
 
         Args: see Recipe class in file recipe.py
         '''
-        self.recipes.append(Recipe(title, ingredients, instructions, tags=tags))
+        self.add_recipe(Recipe(title, ingredients, instructions, tags=tags))
 
     def update(self, title, ingredients, instructions, tags=None):
         '''
@@ -81,10 +472,59 @@ class Cookbook:
             instructions (str): str containing new instructions for recipe
         '''
         rec = self.find_by_title(title)
+        self._unindex_recipe(rec)
         rec.ingredients = Recipe.parse_ingredients(ingredients)
         rec.instructions = instructions
         if tags:
             rec.tags = tags.split(', ')
+        rec.mark_changed()
+        self._index_recipe(rec)
+        self._notify('save', title, rec)
+
+    def _index_recipe(self, recipe, autocomplete=True):
+        '''
+        Adds a recipe (which must already have an id) to all of the indexes.
+        '''
+        recipe_id = self._ids[recipe]
+        self.tag_index.add(recipe_id, recipe.tags)
+        self.ingredient_index.add(recipe_id, recipe.ingredients)
+        self.history.add(recipe_id, recipe.notes)
+        if autocomplete:
+            self.autocomplete.add_recipe(recipe)
+        if self._similarity is not None:
+            self._similarity.add(recipe_id, recipe)
+
+    def _unindex_recipe(self, recipe):
+        '''
+        Removes a recipe from all of the indexes. Must be called before the
+        recipe is modified, so that the indexes can find its old data.
+        '''
+        recipe_id = self._ids[recipe]
+        self.tag_index.remove(recipe_id, recipe.tags)
+        self.ingredient_index.remove(recipe_id)
+        self.history.remove(recipe_id, recipe.notes)
+        self.autocomplete.remove_recipe(recipe)
+        if self._similarity is not None:
+            self._similarity.remove(recipe_id)
+
+    @classmethod
+    def load(cls, storage):
+        '''
+        Loads in a cookbook containing all of the recipes in a storage backend
+        (see storage.py). The cookbook is saved back to the same storage.
+
+        Args:
+            storage (TextFileStorage or SQLiteStorage): storage to load from
+        '''
+        ckbk = cls(storage)
+        for rec in storage.load():
+            ckbk._register(rec, autocomplete=False)
+
+        # adding the terms one at a time keeps every completion list in order
+        # after each one, which is slow for a whole cookbook. build the index
+        # all at once instead; later changes are added one at a time.
+        ckbk.autocomplete.build(ckbk.recipes)
+        return ckbk
 
     @classmethod
     def read_from_dir(cls, directory):
@@ -97,20 +537,7 @@ class Cookbook:
             directory (str): directory in which to search for recipe files.
                 Relative to the directory in which this file is stored.
         '''
-        old_cwd = os.getcwd()
-        os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-        ckbk = cls()
-
-        for fnam in os.listdir(directory):
-            # this is the  mac file that auto-generates to store display
-            # preferences in Finder
-            if fnam == '.DS_Store': continue
-            rec = Recipe.read_from_file(os.path.join(directory, fnam))
-            ckbk.add_recipe(rec)
-
-        os.chdir(old_cwd)
-        return ckbk
+        return cls.load(TextFileStorage(directory))
 
 
 
@@ -0,0 +1,452 @@
+'''
+Exports recipes to a printable HTML or PDF document, with a table of contents
+at the start and an index of tags at the end. Each recipe starts on a new
+page.
+
+Recipes are written to the file one at a time as they are rendered, so the
+whole document is never held in memory; only the titles, page numbers and
+tags needed for the contents and index are kept. The PDF writer only uses
+the standard library, and the built in Helvetica fonts, so no fonts or
+other programs are needed.
+
+Usage:
+    python export.py <output.html or output.pdf> [--directory Recipes]
+'''
+from html import escape
+from math import ceil
+import argparse
+import zlib
+
+def export(recipes, filename, title='Recipe Book'):
+    '''
+    Exports recipes to a file, choosing HTML or PDF from the filename's
+    extension (.pdf for PDF, anything else for HTML).
+
+    Args:
+        recipes (list): list of Recipe objects to export, in order
+        filename (str): file to write to
+        title (str): title of the document
+    '''
+    if filename.lower().endswith('.pdf'):
+        export_pdf(recipes, filename, title=title)
+    else:
+        export_html(recipes, filename, title=title)
+
+def _tag_index(tag_positions):
+    # sorts a dictionary of tag -> list of positions into (tag, positions)
+    # pairs, ignoring case
+    return sorted(tag_positions.items(), key=lambda t: t[0].lower())
+
+
+#———————————————————————————————————HTML————————————————————————————————————————
+
+HTML_STYLE = '''
+body { font-family: Helvetica, Arial, sans-serif; max-width: 45em;
+    margin: 2em auto; line-height: 1.4; }
+section.recipe, nav.index { page-break-before: always; break-before: page; }
+h2 { margin-bottom: 0.3em; }
+ul.ingredients { padding-left: 1.2em; }
+p.tags, p.notes { color: #555; font-size: 0.9em; }
+nav ol { padding-left: 1.5em; }
+@media print { a { color: inherit; text-decoration: none; } }
+'''
+
+def export_html(recipes, filename, title='Recipe Book'):
+    '''
+    Writes recipes to a single HTML file, with a table of contents linking to
+    each recipe, and an index of tags. When printed, each recipe starts on a
+    new page.
+
+    Args:
+        recipes (list): list of Recipe objects to export, in order
+        filename (str): file to write to
+        title (str): title of the document
+    '''
+    tag_positions = {}
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n')
+        f.write(f'<title>{escape(title)}</title>\n')
+        f.write(f'<style>{HTML_STYLE}</style>\n</head>\n<body>\n')
+        f.write(f'<h1>{escape(title)}</h1>\n')
+
+        f.write('<nav class="contents">\n<h2>Contents</h2>\n<ol>\n')
+        for idx, rec in enumerate(recipes):
+            f.write(f'<li><a href="#recipe-{idx}">{escape(rec.title)}</a></li>\n')
+        f.write('</ol>\n</nav>\n')
+
+        for idx, rec in enumerate(recipes):
+            for tag in rec.tags:
+                if tag.strip():
+                    tag_positions.setdefault(tag.strip(), []).append(idx)
+            f.write(_recipe_html(rec, idx))
+
+        f.write('<nav class="index">\n<h2>Index of Tags</h2>\n<dl>\n')
+        for tag, positions in _tag_index(tag_positions):
+            f.write(f'<dt>{escape(tag)}</dt>\n')
+            for idx in positions:
+                f.write(f'<dd><a href="#recipe-{idx}">'
+                    f'{escape(recipes[idx].title)}</a></dd>\n')
+        f.write('</dl>\n</nav>\n</body>\n</html>\n')
+
+def _recipe_html(recipe, idx):
+    parts = [f'<section class="recipe" id="recipe-{idx}">\n',
+        f'<h2>{escape(recipe.title)}</h2>\n', '<ul class="ingredients">\n']
+    for line in recipe.get_ingredients().splitlines():
+        if line.strip():
+            parts.append(f'<li>{escape(line)}</li>\n')
+    parts.append('</ul>\n')
+
+    for paragraph in recipe.instructions.split('\n'):
+        if paragraph.strip():
+            parts.append(f'<p>{escape(paragraph)}</p>\n')
+
+    if recipe.tags:
+        parts.append(f'<p class="tags">Tags: {escape(", ".join(recipe.tags))}</p>\n')
+    for note in recipe.notes:
+        text = note[1] if len(note) > 1 else ''
+        parts.append(f'<p class="notes">{note[0].strftime("%Y-%m-%d")}: '
+            f'{escape(text)}</p>\n')
+    parts.append('</section>\n')
+    return ''.join(parts)
+
+
+#————————————————————————————————————PDF————————————————————————————————————————
+
+# US letter page, in points
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 54
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+
+BODY_SIZE = 11
+HEADING_SIZE = 18
+LEADING = 1.3
+
+# widths of the printable ascii characters (space to ~) in Helvetica, in
+# thousandths of the font size. characters not in here are assumed to be as
+# wide as a digit.
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278,
+    278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584,
+    584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556,
+    833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278,
+    278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222,
+    500, 222, 833, 556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500,
+    500, 334, 260, 334, 584]
+
+def _text_width(text, size, bold=False):
+    width = 0
+    for char in text:
+        code = ord(char) - 32
+        width += HELVETICA_WIDTHS[code] if 0 <= code < 95 else 556
+    # bold letters are a little wider; this overestimates slightly, which is
+    # fine for wrapping
+    if bold:
+        width *= 1.1
+    return width * size / 1000
+
+def _wrap(text, size, width, bold=False):
+    '''
+    Splits text into lines that fit in width points, breaking between words
+    (or within a word, if it is too long for a line by itself).
+    '''
+    space = _text_width(' ', size, bold)
+    lines = []
+    for paragraph in text.split('\n'):
+        line = []
+        line_width = 0
+        for word in paragraph.split():
+            word_width = _text_width(word, size, bold)
+            if line and line_width + space + word_width <= width:
+                line.append(word)
+                line_width += space + word_width
+                continue
+            if line:
+                lines.append(' '.join(line))
+            while word_width > width:
+                cut = len(word) - 1
+                while cut > 1 and _text_width(word[:cut], size, bold) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = _text_width(word, size, bold)
+            line = [word]
+            line_width = word_width
+        lines.append(' '.join(line))
+    return lines
+
+def _truncate(text, size, width, bold=False):
+    if _text_width(text, size, bold) <= width:
+        return text
+    while text and _text_width(text + '...', size, bold) > width:
+        text = text[:-1]
+    return text + '...'
+
+def _pdf_string(text):
+    # pdf strings are written in WinAnsiEncoding, with \\, ( and ) escaped
+    data = text.replace('\t', '    ').encode('cp1252', errors='replace')
+    data = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'(' + data + b')'
+
+
+class PDFWriter:
+    '''
+    Writes a PDF file one page at a time. Objects 1 to 4 are kept for the
+    catalog, page tree and the two fonts, which are written by finish() once
+    the order of all of the pages is known.
+    '''
+    CATALOG = 1
+    PAGES = 2
+    FONTS = {'F1': 3, 'F2': 4}
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.next_object = 5
+        f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def reserve(self):
+        '''
+        Returns a new object number, for an object to be written later.
+        '''
+        number = self.next_object
+        self.next_object += 1
+        return number
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def write_page(self, number, content, annotations=()):
+        '''
+        Writes a page, with object number number, whose content stream is
+        content. annotations is a list of (rect, destination page number)
+        links to add to the page.
+        '''
+        content_number = self.reserve()
+        data = zlib.compress(content)
+        self.write_object(content_number, b'<< /Length %d /Filter /FlateDecode '
+            b'>>\nstream\n' % len(data) + data + b'\nendstream')
+
+        annotation_refs = []
+        for rect, destination in annotations:
+            annotation_number = self.reserve()
+            self.write_object(annotation_number, b'<< /Type /Annot /Subtype '
+                b'/Link /Rect [%.2f %.2f %.2f %.2f] /Border [0 0 0] /Dest '
+                b'[%d 0 R /XYZ 0 %d null] >>' % (rect + (destination,
+                PAGE_HEIGHT)))
+            annotation_refs.append(b'%d 0 R' % annotation_number)
+
+        fonts = b' '.join(b'/%s %d 0 R' % (name.encode(), num)
+            for name, num in PDFWriter.FONTS.items())
+        self.write_object(number, b'<< /Type /Page /Parent %d 0 R /MediaBox '
+            b'[0 0 %d %d] /Resources << /Font << %s >> >> /Contents %d 0 R '
+            b'/Annots [%s] >>' % (PDFWriter.PAGES, PAGE_WIDTH, PAGE_HEIGHT,
+            fonts, content_number, b' '.join(annotation_refs)))
+
+    def finish(self, pages, title):
+        '''
+        Writes the page tree (with pages, a list of page object numbers, in
+        the order they should appear), the fonts, the catalog and the cross
+        reference table.
+        '''
+        kids = b' '.join(b'%d 0 R' % page for page in pages)
+        self.write_object(PDFWriter.PAGES, b'<< /Type /Pages /Kids [%s] '
+            b'/Count %d >>' % (kids, len(pages)))
+        for name, number in PDFWriter.FONTS.items():
+            base = b'Helvetica-Bold' if name == 'F2' else b'Helvetica'
+            self.write_object(number, b'<< /Type /Font /Subtype /Type1 '
+                b'/BaseFont /%s /Encoding /WinAnsiEncoding >>' % base)
+        info = self.reserve()
+        self.write_object(info, b'<< /Title %s /Producer (Recipe Book) >>'
+            % _pdf_string(title))
+        self.write_object(PDFWriter.CATALOG, b'<< /Type /Catalog /Pages %d 0 R '
+            b'>>' % PDFWriter.PAGES)
+
+        xref_offset = self.f.tell()
+        self.f.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_object)
+        for number in range(1, self.next_object):
+            self.f.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.f.write(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\n'
+            b'startxref\n%d\n%%%%EOF\n' % (self.next_object, PDFWriter.CATALOG,
+            info, xref_offset))
+
+
+class _PageLayout:
+    '''
+    Lays out lines of text from the top of the page down, starting a new page
+    whenever one fills up, and writing each page as soon as it is done.
+
+    Attributes:
+        pages (list): object numbers of the pages written so far
+        page_number (int): number printed at the bottom of the current page
+    '''
+    def __init__(self, writer, first_page_number):
+        self.writer = writer
+        self.pages = []
+        self.page_number = first_page_number - 1
+        self._ops = None
+
+    def new_page(self):
+        if self._ops is not None:
+            self.finish_page()
+        self.page_number += 1
+        self.page_object = self.writer.reserve()
+        self._ops = []
+        self._links = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def finish_page(self):
+        if self._ops is None:
+            return
+        footer = str(self.page_number)
+        self._text(footer, (PAGE_WIDTH - _text_width(footer, 9)) / 2,
+            MARGIN / 2, 'F1', 9)
+        self.writer.write_page(self.page_object, b'\n'.join(self._ops),
+            self._links)
+        self.pages.append(self.page_object)
+        self._ops = None
+
+    def line(self, text, size=BODY_SIZE, bold=False, indent=0, right=None,
+            link=None):
+        '''
+        Writes one line of text, moving to a new page first if there isn't
+        room. If right is given, it is written right aligned on the same
+        line. If link is given, the line links to that page object.
+        '''
+        height = size * LEADING
+        if self._ops is None or self.y - height < MARGIN:
+            self.new_page()
+        self.y -= height
+        font = 'F2' if bold else 'F1'
+        self._text(text, MARGIN + indent, self.y, font, size)
+        if right is not None:
+            self._text(right, PAGE_WIDTH - MARGIN - _text_width(right, size),
+                self.y, 'F1', size)
+        if link is not None:
+            self._links.append(((MARGIN, self.y - size * 0.25,
+                PAGE_WIDTH - MARGIN, self.y + size), link))
+
+    def paragraph(self, text, size=BODY_SIZE, bold=False, indent=0):
+        for line in _wrap(text, size, TEXT_WIDTH - indent, bold):
+            self.line(line, size=size, bold=bold, indent=indent)
+
+    def space(self, points):
+        self.y -= points
+
+    def _text(self, text, x, y, font, size):
+        self._ops.append(b'BT /%s %d Tf %.2f %.2f Td %s Tj ET'
+            % (font.encode(), size, x, y, _pdf_string(text)))
+
+
+def _toc_page_count(count):
+    # the contents has a heading, then one line per recipe. this has to match
+    # how _PageLayout fills pages, so that recipe page numbers can be worked
+    # out before the contents is written.
+    usable = PAGE_HEIGHT - 2 * MARGIN
+    heading = HEADING_SIZE * LEADING + BODY_SIZE
+    first_page = int((usable - heading) // (BODY_SIZE * LEADING))
+    per_page = int(usable // (BODY_SIZE * LEADING))
+    if count <= first_page:
+        return 1
+    return 1 + ceil((count - first_page) / per_page)
+
+def export_pdf(recipes, filename, title='Recipe Book'):
+    '''
+    Writes recipes to a PDF file, with a table of contents (with page numbers
+    and links) at the start, and an index of tags at the end. Each recipe
+    starts on a new page.
+
+    Args:
+        recipes (list): list of Recipe objects to export, in order
+        filename (str): file to write to
+        title (str): title of the document
+    '''
+    toc_pages = _toc_page_count(len(recipes))
+    recipe_pages = []
+    tag_positions = {}
+
+    with open(filename, 'wb') as f:
+        writer = PDFWriter(f)
+
+        # recipes are written first, since their page numbers are needed for
+        # the contents. the pages are put back in order by finish().
+        body = _PageLayout(writer, toc_pages + 1)
+        for idx, rec in enumerate(recipes):
+            body.new_page()
+            recipe_pages.append((body.page_number, body.page_object))
+            for tag in rec.tags:
+                if tag.strip():
+                    tag_positions.setdefault(tag.strip(), []).append(idx)
+            _layout_recipe(body, rec)
+
+        body.new_page()
+        body.line('Index of Tags', size=HEADING_SIZE, bold=True)
+        body.space(BODY_SIZE)
+        for tag, positions in _tag_index(tag_positions):
+            body.line(_truncate(tag, BODY_SIZE, TEXT_WIDTH, bold=True),
+                bold=True)
+            for idx in positions:
+                page_number, page_object = recipe_pages[idx]
+                body.line(_truncate(recipes[idx].title, BODY_SIZE,
+                    TEXT_WIDTH - 60), indent=12, right=str(page_number),
+                    link=page_object)
+            body.space(BODY_SIZE * 0.5)
+        body.finish_page()
+
+        contents = _PageLayout(writer, 1)
+        contents.new_page()
+        contents.line(_truncate(title, HEADING_SIZE, TEXT_WIDTH, bold=True),
+            size=HEADING_SIZE, bold=True)
+        contents.space(BODY_SIZE)
+        for rec, (page_number, page_object) in zip(recipes, recipe_pages):
+            contents.line(_truncate(rec.title, BODY_SIZE, TEXT_WIDTH - 40),
+                right=str(page_number), link=page_object)
+        contents.finish_page()
+
+        writer.finish(contents.pages + body.pages, title)
+
+def _layout_recipe(layout, recipe):
+    layout.paragraph(recipe.title, size=HEADING_SIZE, bold=True)
+    layout.space(BODY_SIZE * 0.5)
+
+    layout.line('Ingredients', bold=True)
+    for ing_line in recipe.get_ingredients().splitlines():
+        if ing_line.strip():
+            layout.paragraph('\u2022 ' + ing_line.strip(), indent=12)
+    layout.space(BODY_SIZE * 0.5)
+
+    layout.line('Instructions', bold=True)
+    for paragraph in recipe.instructions.split('\n'):
+        if paragraph.strip():
+            layout.paragraph(paragraph)
+            layout.space(BODY_SIZE * 0.3)
+
+    if recipe.tags:
+        layout.space(BODY_SIZE * 0.5)
+        layout.paragraph('Tags: ' + ', '.join(recipe.tags), size=9)
+    if recipe.notes:
+        layout.space(BODY_SIZE * 0.5)
+        layout.line("Cook's Notes", bold=True)
+        for note in recipe.notes:
+            text = note[1] if len(note) > 1 else ''
+            layout.paragraph(note[0].strftime('%Y-%m-%d') + ': ' + text,
+                size=9)
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    arg_parser = argparse.ArgumentParser(
+        description='Export a cookbook to a printable HTML or PDF file.')
+    arg_parser.add_argument('output', help='file to write (.html or .pdf)')
+    arg_parser.add_argument('--directory', default='Recipes',
+        help='recipes directory, or .db file (default: Recipes)')
+    args = arg_parser.parse_args()
+
+    storage = open_storage(args.directory)
+    recipes = sorted(storage.load(), key=lambda r: r.title.lower())
+    storage.close()
+    export(recipes, args.output)
+    print(f'Exported {len(recipes)} recipes to {args.output}.')
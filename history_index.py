@@ -0,0 +1,114 @@
+from bisect import bisect_left, bisect_right, insort
+
+class HistoryIndex:
+    '''
+    Index of when each recipe in a cookbook was cooked, built from the
+    (datetime, text) notes stored on each recipe. Everything is kept in
+    sorted lists, so that date range queries are done by bisection.
+
+    Attributes:
+        events (list): sorted list of (date, recipe_id, text) tuples, one for
+            every note on every recipe
+        last_cooked (dict): maps recipe id to the date of its latest note, for
+            recipes that have notes
+        by_last_cooked (list): sorted list of (last_cooked_date, recipe_id)
+            tuples, one for each recipe that has notes
+        uncooked (set): ids of the recipes that have no notes
+    '''
+    def __init__(self):
+        self.events = []
+        self.last_cooked = {}
+        self.by_last_cooked = []
+        self.uncooked = set()
+
+    @staticmethod
+    def _event(recipe_id, note):
+        # notes that were saved without any text only have a date
+        text = note[1] if len(note) > 1 else ''
+        return (note[0], recipe_id, text)
+
+    def add(self, recipe_id, notes):
+        '''
+        Adds a recipe and all of its notes to the index.
+
+        Args:
+            recipe_id (int): id of the recipe to add
+            notes (list): the recipe's list of (datetime, text) notes
+        '''
+        self.uncooked.add(recipe_id)
+        for note in notes:
+            self.add_note(recipe_id, note)
+
+    def add_note(self, recipe_id, note):
+        '''
+        Adds one new note for a recipe which is already in the index.
+
+        Args:
+            recipe_id (int): id of the recipe the note is for
+            note (tuple): (datetime, text) tuple of the note
+        '''
+        event = HistoryIndex._event(recipe_id, note)
+        insort(self.events, event)
+        self.uncooked.discard(recipe_id)
+
+        last = self.last_cooked.get(recipe_id)
+        if last is not None and last >= event[0]:
+            return
+        if last is not None:
+            self._remove_sorted(self.by_last_cooked, (last, recipe_id))
+        self.last_cooked[recipe_id] = event[0]
+        insort(self.by_last_cooked, (event[0], recipe_id))
+
+    def remove(self, recipe_id, notes):
+        '''
+        Removes a recipe and all of its notes from the index. Notes should be
+        the same ones the recipe was added with.
+
+        Args:
+            recipe_id (int): id of the recipe to remove
+            notes (list): the recipe's list of (datetime, text) notes
+        '''
+        self.uncooked.discard(recipe_id)
+        for note in notes:
+            self._remove_sorted(self.events,
+                HistoryIndex._event(recipe_id, note))
+
+        last = self.last_cooked.pop(recipe_id, None)
+        if last is not None:
+            self._remove_sorted(self.by_last_cooked, (last, recipe_id))
+
+    def between(self, start, end):
+        '''
+        Returns the list of (date, recipe_id, text) events with start <= date
+        <= end, sorted by date.
+        '''
+        lo = bisect_left(self.events, (start,))
+        hi = bisect_right(self.events, (end, float('inf')))
+        return self.events[lo:hi]
+
+    def not_cooked_since(self, date):
+        '''
+        Returns the list of ids of recipes that haven't been cooked on or
+        after the given date, least recently cooked first, followed by the
+        recipes that have never been cooked.
+        '''
+        hi = bisect_left(self.by_last_cooked, (date,))
+        return [e[1] for e in self.by_last_cooked[:hi]] + sorted(self.uncooked)
+
+    def most_cooked(self, start, end, n=10):
+        '''
+        Returns a list of up to n (recipe_id, times_cooked) tuples for the
+        recipes cooked the most times between start and end (inclusive), most
+        cooked first.
+        '''
+        counts = {}
+        for event in self.between(start, end):
+            counts[event[1]] = counts.get(event[1], 0) + 1
+        ranked = sorted(counts.items(), key=lambda c: (-c[1], c[0]))
+        return ranked[:n]
+
+    @staticmethod
+    def _remove_sorted(sorted_list, item):
+        idx = bisect_left(sorted_list, item)
+        if idx < len(sorted_list) and sorted_list[idx] == item:
+            del sorted_list[idx]
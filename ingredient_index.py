@@ -0,0 +1,114 @@
+from recipe import Recipe
+
+class IngredientIndex:
+    '''
+    Inverted index from ingredient names to the recipes which use them, used
+    to find recipes that can be made from a given set of ingredients. Names
+    are normalised with Recipe.normalise_name before being stored or looked
+    up.
+
+    Attributes:
+        postings (dict): maps each normalised ingredient name to the set of
+            ids of recipes using it
+        names (dict): maps each recipe id to the set of normalised
+            ingredient names in that recipe
+    '''
+    def __init__(self):
+        self.postings = {}
+        self.names = {}
+
+    @staticmethod
+    def ingredient_names(ingredients):
+        '''
+        Returns the set of normalised names in a list of ingredient tuples,
+        in the format returned by Recipe.parse_ingredients.
+        '''
+        names = {Recipe.normalise_name(ing[2]) for ing in ingredients}
+        names.discard('')
+        return names
+
+    def add(self, recipe_id, ingredients):
+        '''
+        Adds a recipe to the index.
+
+        Args:
+            recipe_id (int): id of the recipe to add
+            ingredients (list): the recipe's list of ingredient tuples
+        '''
+        names = IngredientIndex.ingredient_names(ingredients)
+        self.names[recipe_id] = names
+        for name in names:
+            self.postings.setdefault(name, set()).add(recipe_id)
+
+    def remove(self, recipe_id):
+        '''
+        Removes a recipe from the index.
+
+        Args:
+            recipe_id (int): id of the recipe to remove
+        '''
+        for name in self.names.pop(recipe_id, ()):
+            posting = self.postings[name]
+            posting.discard(recipe_id)
+            if not posting:
+                del self.postings[name]
+
+    def match(self, pantry, max_missing=0):
+        '''
+        Finds the recipes which use at least one of the ingredients in the
+        pantry and are missing at most max_missing of their ingredients.
+        Only the recipes in the pantry ingredients' postings are looked at,
+        so recipes sharing nothing with the pantry cost nothing.
+
+        Args:
+            pantry (iterable): ingredient names that are available
+            max_missing (int): largest number of missing ingredients a
+                recipe can have and still be returned
+
+        Returns:
+            matches (list): list of (recipe_id, have, missing) tuples, where
+                have is the number of the recipe's ingredients in the pantry
+                and missing is the set of normalised names that are not. Sorted
+                by fewest missing ingredients, then by most ingredients had.
+        '''
+        pantry_names = {Recipe.normalise_name(name) for name in pantry}
+
+        have_counts = {}
+        for name in pantry_names:
+            for recipe_id in self.postings.get(name, ()):
+                have_counts[recipe_id] = have_counts.get(recipe_id, 0) + 1
+
+        matches = []
+        for recipe_id, have in have_counts.items():
+            if len(self.names[recipe_id]) - have > max_missing:
+                continue
+            missing = self.names[recipe_id] - pantry_names
+            matches.append((recipe_id, have, missing))
+
+        matches.sort(key=lambda m: (len(m[2]), -m[1], m[0]))
+        return matches
+
+    def using(self, ingredients):
+        '''
+        Finds the recipes which use any of a set of ingredients, i.e. to use
+        up ingredients that are about to go off. Only the given ingredients'
+        postings are looked at.
+
+        Args:
+            ingredients (iterable): ingredient names to look for
+
+        Returns:
+            matches (list): list of (recipe_id, used) tuples, where used is
+                the set of the given (normalised) names the recipe uses.
+                Sorted by most of the ingredients used, then by fewest other
+                ingredients needed.
+        '''
+        used = {}
+        for name in {Recipe.normalise_name(name) for name in ingredients}:
+            for recipe_id in self.postings.get(name, ()):
+                used.setdefault(recipe_id, set()).add(name)
+
+        matches = list(used.items())
+        matches.sort(key=lambda m: (-len(m[1]),
+            len(self.names[m[0]]) - len(m[1]), m[0]))
+        return matches
@@ -0,0 +1,175 @@
+from recipe import PACKAGE_DIR
+import csv
+import io
+import os
+
+# recipes used to be saved as <title>.txt, so this can't be the name of a
+# recipe file from before manifests existed
+MANIFEST_NAME = 'manifest.tsv'
+
+class Manifest:
+    '''
+    Records which file each recipe in a recipes directory is saved in, so that
+    recipes can be loaded without listing the directory.
+
+    The manifest is a tab separated file in the recipes directory with one
+    "title<TAB>path" row per recipe, where path is relative to the recipes
+    directory. Changes are appended to the end of the file as they happen, so
+    a later row for a title replaces an earlier one, and a row with an empty
+    path means the recipe was deleted. compact() rewrites the file with just
+    the current rows.
+
+    More than one program can use the same manifest at once (i.e. the recipe
+    book, and web_import.py saving into the same directory). Before appending
+    to the file or rewriting it, any rows another program has appended since
+    it was last read are read in, so that they aren't lost.
+
+    The manifest file is only ever created by compact(), so if it exists it
+    lists every recipe. Until then, changes are only kept in memory, and the
+    recipes directory is loaded by searching it for recipe files instead.
+
+    Attributes:
+        directory (str): absolute path of the recipes directory
+        paths (dict): maps each recipe title to its file's path, relative to
+            the recipes directory
+    '''
+    def __init__(self, directory):
+        self.directory = os.path.join(PACKAGE_DIR, directory)
+        self.paths = {}
+
+        # (device, inode) of the manifest file that has been read, or None if
+        # it hasn't been, and how many bytes of it have been read
+        self._file_id = None
+        self._read_to = 0
+
+    @property
+    def filename(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    @classmethod
+    def load(cls, directory):
+        '''
+        Reads in the manifest of a recipes directory.
+
+        Args:
+            directory (str): recipes directory
+
+        Returns:
+            manifest (Manifest or None): the directory's manifest, or None if
+                the directory doesn't have one
+        '''
+        manifest = cls(directory)
+        if not manifest._read_rows(force=True):
+            return None
+        return manifest
+
+    def record(self, title, path, append=True):
+        '''
+        Records the file a recipe is saved in.
+
+        Args:
+            title (str): title of the recipe
+            path (str): path to the recipe's file, relative to the recipes
+                directory
+            append (bool): whether to append the change to the manifest file
+                straight away. When saving many recipes at once, pass False
+                and call compact() once at the end instead.
+        '''
+        if append:
+            self._read_rows()
+        if self.paths.get(title) == path:
+            return
+        self.paths[title] = path
+        if append:
+            self._append_rows([(title, path)])
+
+    def record_many(self, paths):
+        '''
+        Records the files of many recipes at once, appending all of the
+        changes to the manifest file together.
+
+        Args:
+            paths (list): list of (title, path) tuples, as in record()
+        '''
+        self._read_rows()
+        changed = [(title, path) for title, path in paths
+            if self.paths.get(title) != path]
+        for title, path in changed:
+            self.paths[title] = path
+        self._append_rows(changed)
+
+    def forget(self, title):
+        '''
+        Removes a (deleted) recipe from the manifest.
+        '''
+        self._read_rows()
+        if self.paths.pop(title, None) is not None:
+            self._append_rows([(title, '')])
+
+    def compact(self):
+        '''
+        Rewrites the manifest file with one row per recipe, dropping the rows
+        that have been replaced or deleted.
+        '''
+        self._read_rows()
+        os.makedirs(self.directory, exist_ok=True)
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            for title, path in self.paths.items():
+                writer.writerow([title, path])
+        os.replace(temp_filename, self.filename)
+
+        stat = os.stat(self.filename)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        self._read_to = stat.st_size
+
+    def _read_rows(self, force=False):
+        '''
+        Reads in the rows added to the manifest file since it was last read.
+        If the file has been replaced since then (i.e. compacted by another
+        program), all of it is read again, on top of the paths already known.
+        Does nothing if the file has never been read, unless force is True,
+        since the paths were then found some other way (i.e. by searching the
+        directory) and the file is out of date.
+
+        Returns:
+            exists (bool): whether the manifest file exists
+        '''
+        if self._file_id is None and not force:
+            return os.path.exists(self.filename)
+        try:
+            with open(self.filename, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                file_id = (stat.st_dev, stat.st_ino)
+                if file_id != self._file_id or stat.st_size < self._read_to:
+                    self._file_id = file_id
+                    self._read_to = 0
+                f.seek(self._read_to)
+                data = f.read()
+        except FileNotFoundError:
+            return False
+
+        # a row that is still being written is left until it is finished
+        data = data[:data.rfind(b'\n') + 1]
+        self._read_to += len(data)
+        text = io.StringIO(data.decode('utf-8', errors='replace'), newline='')
+        for row in csv.reader(text, delimiter='\t'):
+            if len(row) < 2:
+                continue
+            if row[1]:
+                self.paths[row[0]] = row[1]
+            else:
+                self.paths.pop(row[0], None)
+        return True
+
+    def _append_rows(self, rows):
+        # callers read in the rows appended by other programs first, so that
+        # these rows come after them in self.paths as well as in the file.
+        # this program's own rows are read back in later, which changes
+        # nothing.
+        if not rows or not os.path.exists(self.filename):
+            return
+        with open(self.filename, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerows(rows)
@@ -0,0 +1,292 @@
+from recipe import Recipe, PACKAGE_DIR
+from datetime import datetime, timedelta
+import csv
+import os
+import re
+
+MEALS = ('Breakfast', 'Lunch', 'Dinner')
+
+def week_of(date):
+    '''
+    Returns the (ISO year, ISO week number) of the week a date is in. Weeks
+    start on Monday.
+    '''
+    return tuple(date.isocalendar()[:2])
+
+def week_start(date):
+    '''
+    Returns the Monday (at midnight) of the week a date is in.
+    '''
+    day = datetime(date.year, date.month, date.day)
+    return day - timedelta(days=day.weekday())
+
+
+class _Rollup:
+    '''
+    Running totals of ingredient amounts and tag counts for a group of meal
+    plan slots (i.e. a day or a week), which slots' contributions are added to
+    and subtracted from as the plan changes.
+
+    Attributes:
+        ingredients (dict): maps (normalised name, unit) to [amount,
+            spellings], where spellings maps each way the ingredient's name
+            is written in the slots' recipes to the number of slots using it
+            (see shopping_list). Entries are removed when no slots use them,
+            so no rounding error is left behind from amounts added and taken
+            away again.
+        tags (dict): maps each tag to the number of slots with it
+        slots (int): number of slots added up
+    '''
+    __slots__ = ('ingredients', 'tags', 'slots')
+
+    def __init__(self):
+        self.ingredients = {}
+        self.tags = {}
+        self.slots = 0
+
+    def add(self, contribution, sign=1):
+        ingredients, tags = contribution
+        self.slots += sign
+        for key, (amount, name) in ingredients.items():
+            entry = self.ingredients.setdefault(key, [0, {}])
+            entry[0] += sign * amount
+            spellings = entry[1]
+            spellings[name] = spellings.get(name, 0) + sign
+            if spellings[name] == 0:
+                del spellings[name]
+                if not spellings:
+                    del self.ingredients[key]
+        for tag in tags:
+            self.tags[tag] = self.tags.get(tag, 0) + sign
+            if self.tags[tag] == 0:
+                del self.tags[tag]
+
+    def shopping_list(self):
+        '''
+        Returns the ingredient totals as text, one ingredient per line, in the
+        same format as a recipe's ingredient list. Each ingredient is shown
+        with the spelling from its recipes that agrees with its total (i.e.
+        "5 tomatoes" rather than "5 tomato"), using the most common one if
+        there is more than one.
+        '''
+        ingredients = []
+        for key, (amount, spellings) in self.ingredients.items():
+            plural = amount > 1
+            # max keeps the first of equally good spellings, so ties go to
+            # the one added first
+            name = max(spellings, key=lambda n: (
+                _is_plural(n, key[0]) == plural, spellings[n]))
+            ingredients.append((amount, key[1], name))
+        ingredients.sort(key=lambda ing: ing[2].lower())
+        return Recipe.unparse_ingredients(ingredients)
+
+
+class MealPlan:
+    '''
+    A plan of which recipes to cook on which days, with the ingredients
+    needed (a shopping list) and the tags of the planned meals added up for
+    each day and each week.
+
+    The totals are kept up to date as the plan changes: when a slot is
+    changed, its old contribution is taken off its day's and week's totals
+    and the new one is added on, so nothing is added up again from the rest
+    of the plan. The plan also subscribes to the cookbook's change
+    notifications, so that if a planned recipe is edited, the slots using it
+    are updated.
+
+    The plan is saved in a tab separated file with one
+    "date<TAB>meal<TAB>title<TAB>multiplier" row per slot.
+
+    Attributes:
+        cookbook (Cookbook): cookbook the planned recipes come from
+        filename (str): absolute path of the file the plan is saved in
+        slots (dict): maps each (date, meal) slot to a (title, multiplier)
+            tuple, where date is a datetime at midnight, and multiplier is
+            how many times the recipe is made (i.e. 2 to double it)
+        days (dict): maps each date to the _Rollup of its slots
+        weeks (dict): maps each (ISO year, week) to the _Rollup of its slots
+    '''
+    def __init__(self, cookbook, filename='mealplan.txt'):
+        self.cookbook = cookbook
+        self.filename = os.path.join(PACKAGE_DIR, filename)
+        self.slots = {}
+        self.days = {}
+        self.weeks = {}
+
+        # contribution of each slot to the totals, as it was when it was
+        # added, so that it can be taken off again exactly
+        self._contributions = {}
+        # maps each title to the set of slots it is planned in, and each date
+        # to the set of meals planned on it
+        self._slots_by_title = {}
+        self._meals_by_day = {}
+
+        cookbook.subscribe(self._on_change)
+
+    @classmethod
+    def load(cls, cookbook, filename='mealplan.txt'):
+        '''
+        Reads a meal plan in from its file. Slots for recipes which are no
+        longer in the cookbook are left out. If the file doesn't exist yet,
+        the plan is empty.
+        '''
+        plan = cls(cookbook, filename)
+        if not os.path.exists(plan.filename):
+            return plan
+
+        with open(plan.filename, 'r', newline='') as f:
+            for row in csv.reader(f, delimiter='\t'):
+                if len(row) < 4:
+                    continue
+                try:
+                    date = datetime.strptime(row[0], '%Y-%m-%d')
+                    multiplier = float(row[3])
+                except ValueError:
+                    continue
+                try:
+                    plan.set(date, row[1], row[2], multiplier)
+                except KeyError:
+                    continue
+        return plan
+
+    def save(self):
+        '''
+        Writes the plan to its file.
+        '''
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'w', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            for (date, meal), (title, multiplier) in sorted(self.slots.items(),
+                    key=lambda s: (s[0][0], _meal_order(s[0][1]))):
+                writer.writerow([date.strftime('%Y-%m-%d'), meal, title,
+                    f'{multiplier:g}'])
+        os.replace(temp_filename, self.filename)
+
+    def set(self, date, meal, title, multiplier=1):
+        '''
+        Plans a recipe for a meal, replacing whatever was planned for it
+        before.
+
+        Args:
+            date (datetime): day of the meal
+            meal (str): which meal it is, i.e. "Dinner"
+            title (str): title of the recipe to make
+            multiplier (float): how many times to make the recipe, i.e. 0.5
+                to halve it
+
+        Raises:
+            KeyError: if there is no recipe with that title in the cookbook
+        '''
+        recipe = self.cookbook.find_by_title(title)
+        if recipe is None:
+            raise KeyError(title)
+
+        slot = (_day(date), meal)
+        self.clear(*slot)
+        self.slots[slot] = (title, multiplier)
+        self._slots_by_title.setdefault(title, set()).add(slot)
+        self._meals_by_day.setdefault(slot[0], set()).add(meal)
+        self._add_contribution(slot, recipe, multiplier)
+
+    def clear(self, date, meal):
+        '''
+        Removes whatever is planned for a meal.
+        '''
+        slot = (_day(date), meal)
+        planned = self.slots.pop(slot, None)
+        if planned is None:
+            return
+
+        slots = self._slots_by_title[planned[0]]
+        slots.discard(slot)
+        if not slots:
+            del self._slots_by_title[planned[0]]
+        meals = self._meals_by_day[slot[0]]
+        meals.discard(meal)
+        if not meals:
+            del self._meals_by_day[slot[0]]
+
+        contribution = self._contributions.pop(slot)
+        for rollup, key in ((self.days, slot[0]), (self.weeks, week_of(slot[0]))):
+            rollup[key].add(contribution, sign=-1)
+            if rollup[key].slots == 0:
+                del rollup[key]
+
+    def day(self, date):
+        '''
+        Returns the meals planned on a day, as a list of (meal, title,
+        multiplier) tuples in the order of the meals in the day.
+        '''
+        date = _day(date)
+        planned = [(meal,) + self.slots[(date, meal)]
+            for meal in self._meals_by_day.get(date, ())]
+        return sorted(planned, key=lambda p: _meal_order(p[0]))
+
+    def prep_list(self, date):
+        '''
+        Returns the prep list for a day: the ingredients of each planned
+        recipe, scaled by its multiplier, as text.
+        '''
+        lines = []
+        for meal, title, multiplier in self.day(date):
+            recipe = self.cookbook.find_by_title(title)
+            scaled = [(ing[0] * multiplier, ing[1], ing[2])
+                for ing in recipe.ingredients]
+            times = f' (x{multiplier:g})' if multiplier != 1 else ''
+            lines.append(f'{meal}: {title}{times}')
+            lines += ['    ' + l for l in
+                Recipe.unparse_ingredients(scaled).splitlines()]
+        return '\n'.join(lines)
+
+    def day_totals(self, date):
+        '''
+        Returns the _Rollup of ingredients and tags for a day (empty if
+        nothing is planned).
+        '''
+        return self.days.get(_day(date), _Rollup())
+
+    def week_totals(self, date):
+        '''
+        Returns the _Rollup of ingredients and tags for the week a date is in
+        (empty if nothing is planned).
+        '''
+        return self.weeks.get(week_of(date), _Rollup())
+
+    def _add_contribution(self, slot, recipe, multiplier):
+        # maps (normalised name, unit) to (amount, name as written)
+        ingredients = {}
+        for number, unit, name in recipe.ingredients:
+            key = (Recipe.normalise_name(name) or name, unit)
+            amount, first_name = ingredients.get(key, (0, name))
+            ingredients[key] = (amount + number * multiplier, first_name)
+        contribution = (ingredients, {t.strip() for t in recipe.tags if t.strip()})
+
+        self._contributions[slot] = contribution
+        self.days.setdefault(slot[0], _Rollup()).add(contribution)
+        self.weeks.setdefault(week_of(slot[0]), _Rollup()).add(contribution)
+
+    def _on_change(self, kind, title, recipe):
+        # called by the cookbook after a recipe is added, changed or deleted
+        slots = self._slots_by_title.get(title)
+        if not slots:
+            return
+        for slot in list(slots):
+            multiplier = self.slots[slot][1]
+            self.clear(*slot)
+            if kind != 'delete':
+                self.set(slot[0], slot[1], title, multiplier)
+
+
+def _is_plural(name, normalised_name):
+    # whether an ingredient name ends in a plural word, going by whether
+    # Recipe.normalise_name changed its last word (i.e. "Tomatoes" or
+    # "tomatoes (ripe)", but not "tomato")
+    words = re.sub(r'[^\w\s]', ' ',
+        re.sub(r'\(.*?\)', ' ', name.lower())).split()
+    return bool(words) and words[-1] != normalised_name.split()[-1]
+
+def _day(date):
+    return datetime(date.year, date.month, date.day)
+
+def _meal_order(meal):
+    return (MEALS.index(meal) if meal in MEALS else len(MEALS), meal)
@@ -0,0 +1,213 @@
+from recipe import Recipe, load_table, PACKAGE_DIR
+from datetime import datetime, timedelta
+import csv
+import heapq
+import os
+
+def pantry_name(name):
+    '''
+    Returns the name an ingredient is kept under in the pantry and the shelf
+    life table: the name normalised with Recipe.normalise_name, or, if that is
+    in the ingredient alias table, the more general name it is listed under
+    (i.e. "Red Bell Peppers" -> "bell pepper").
+    '''
+    name = Recipe.normalise_name(name)
+    return load_table('ingredient_aliases.txt').get(name, name)
+
+def recipe_names(names):
+    '''
+    Returns the set of (normalised) ingredient names in recipes which are kept
+    under any of the given pantry names: the names themselves and their
+    aliases. Used to find recipes which use items in the pantry, matching
+    names the same way pantry_name does.
+    '''
+    names = set(names)
+    found = set(names)
+    for alias, name in load_table('ingredient_aliases.txt').items():
+        if name in names:
+            found.add(alias)
+    return found
+
+def shelf_life(name):
+    '''
+    Looks up how many days an ingredient keeps after it is bought, in the
+    shelf life table.
+
+    Args:
+        name (str): ingredient name, which is looked up by its pantry_name
+
+    Returns:
+        days (int or None): days the ingredient keeps, or None if it isn't
+            in the table
+    '''
+    days = load_table('shelf_life.txt').get(pantry_name(name))
+    return int(days) if days is not None else None
+
+
+class Pantry:
+    '''
+    Keeps track of when perishable ingredients were bought and when they will
+    go off, so that the user can be reminded to use them.
+
+    Upcoming reminders are kept in a heap ordered by when they are due, so the
+    next one can be found (to schedule it) and taken off in O(log n) time.
+    Items that are used up or bought again aren't searched for in the heap;
+    their old entries are just skipped when they reach the top.
+
+    The pantry is saved in a tab separated file with one
+    "name<TAB>bought<TAB>expires" row per item.
+
+    Attributes:
+        filename (str): absolute path of the file the pantry is saved in
+        warn_days (int): how many days before an item expires to remind the
+            user about it
+        items (dict): maps each ingredient's pantry_name to a (bought,
+            expires) tuple of datetimes
+    '''
+    def __init__(self, filename='pantry.txt', warn_days=2):
+        self.filename = os.path.join(PACKAGE_DIR, filename)
+        self.warn_days = warn_days
+        self.items = {}
+
+        # heap of (remind_at, seq, name) entries. seq breaks ties, and is
+        # used to tell whether an entry is still current: _current maps each
+        # name to the seq of its latest entry.
+        self._heap = []
+        self._current = {}
+        self._seq = 0
+
+    @classmethod
+    def load(cls, filename='pantry.txt', warn_days=2):
+        '''
+        Reads a pantry in from its file. If the file doesn't exist yet, the
+        pantry is empty.
+        '''
+        pantry = cls(filename, warn_days=warn_days)
+        if not os.path.exists(pantry.filename):
+            return pantry
+
+        with open(pantry.filename, 'r', newline='') as f:
+            for row in csv.reader(f, delimiter='\t'):
+                if len(row) < 3:
+                    continue
+                try:
+                    bought = datetime.strptime(row[1], '%Y-%m-%d')
+                    expires = datetime.strptime(row[2], '%Y-%m-%d')
+                except ValueError:
+                    continue
+                pantry._set(row[0], bought, expires)
+        return pantry
+
+    def save(self):
+        '''
+        Writes the pantry to its file.
+        '''
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'w', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            for name, (bought, expires) in self.items.items():
+                writer.writerow([name, bought.strftime('%Y-%m-%d'),
+                    expires.strftime('%Y-%m-%d')])
+        os.replace(temp_filename, self.filename)
+
+    def add(self, name, bought=None, days=None):
+        '''
+        Records that an ingredient was bought. If it was already in the
+        pantry, the new purchase replaces the old one.
+
+        Args:
+            name (str): ingredient name. It is kept under its pantry_name,
+                so that it matches the names of ingredients in recipes.
+            bought (datetime): when it was bought (default now)
+            days (int): how many days it keeps. By default this is looked up
+                in the shelf life table.
+
+        Returns:
+            expires (datetime or None): when the ingredient will go off, or
+                None if days wasn't given and the ingredient isn't in the
+                shelf life table (in which case it isn't added)
+        '''
+        if bought is None:
+            bought = datetime.now()
+        if days is None:
+            days = shelf_life(name)
+            if days is None:
+                return None
+
+        bought = datetime(bought.year, bought.month, bought.day)
+        expires = bought + timedelta(days=days)
+        self._set(pantry_name(name), bought, expires)
+        return expires
+
+    def remove(self, name):
+        '''
+        Removes an ingredient (i.e. once it has been used up) from the
+        pantry.
+        '''
+        name = pantry_name(name)
+        self.items.pop(name, None)
+        self._current.pop(name, None)
+
+    def next_reminder(self):
+        '''
+        Returns the time of the next reminder that is due, or None if there
+        are no reminders left.
+        '''
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def due(self, now=None):
+        '''
+        Takes the reminders that are due off the queue. Each purchase is only
+        reminded about once (until the pantry is loaded again).
+
+        Args:
+            now (datetime): time to check against (default now)
+
+        Returns:
+            due (list): list of (name, expires) tuples for the items which
+                are due to be reminded about, soonest expiring first
+        '''
+        if now is None:
+            now = datetime.now()
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, _, name = heapq.heappop(self._heap)
+            del self._current[name]
+            due.append((name, self.items[name][1]))
+        return due
+
+    def expiring(self, within_days=None, now=None):
+        '''
+        Returns the items in the pantry which expire within a number of days
+        (default warn_days), soonest first, as (name, expires) tuples. Items
+        that have already expired are included.
+        '''
+        if within_days is None:
+            within_days = self.warn_days
+        if now is None:
+            now = datetime.now()
+        cutoff = now + timedelta(days=within_days)
+        return sorted(((name, expires) for name, (bought, expires)
+            in self.items.items() if expires <= cutoff), key=lambda i: i[1])
+
+    def _set(self, name, bought, expires):
+        self.items[name] = (bought, expires)
+        self._seq += 1
+        self._current[name] = self._seq
+        heapq.heappush(self._heap,
+            (expires - timedelta(days=self.warn_days), self._seq, name))
+
+        # rebuild the heap if it is mostly stale entries, so it doesn't keep
+        # growing when the same items are bought again and again
+        if len(self._heap) > 2 * len(self._current) + 16:
+            self._heap = [e for e in self._heap
+                if self._current.get(e[2]) == e[1]]
+            heapq.heapify(self._heap)
+
+    def _discard_stale(self):
+        while self._heap and self._current.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
@@ -1,35 +1,76 @@
 import os
 import re
+import hashlib
 from datetime import datetime
+from itertools import count
+from functools import lru_cache
 import csv
 import sys
 from math import isclose, floor
 import logging
 logging.basicConfig(level=logging.INFO)
 
-#read in the unit conversion as a dictionary, so that it can be used to parse
-# ingredient lists.
-unit_conversions = {}
-with open('tables/unit_conversions.txt', 'r', newline='') as f:
-    reader = csv.reader(f, delimiter='\t')
-    next(reader)
-    for row in reader:
-        unit_conversions[row[0]] = row[1]
+# directory containing this file. relative paths used by the program (for
+# recipes, lookup tables and saved data) are relative to it, so they can be
+# found no matter what the current working directory is
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLES_DIR = os.path.join(PACKAGE_DIR, 'tables')
+
+@lru_cache(maxsize=None)
+def load_table(name):
+    '''
+    Reads in one of the tab separated tables in the tables directory as a
+    dictionary mapping the first column to the second. The first line of each
+    table is a comment, and is skipped. Tables are only read the first time
+    they are asked for; after that the same dictionary is returned.
+
+    Args:
+        name (str): filename of the table, e.g. "unit_conversions.txt"
+
+    Returns:
+        table (dict): dictionary of the table's rows
+    '''
+    table = {}
+    with open(os.path.join(TABLES_DIR, name), 'r', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader)
+        for row in reader:
+            if len(row) >= 2:
+                table[row[0]] = row[1]
+    return table
+
+def get_unit_conversions():
+    '''
+    Returns the dictionary of unit conversions used to parse ingredient
+    lists, which maps the way a unit might be written to its standard form.
+    '''
+    return load_table('unit_conversions.txt')
 
 class Recipe:
     '''Holds information associated with one recipe.
 
     Attributes:
         title (str): title of recipe
-        ingredients (str): string of ingredients in the format as listed
-            in the parse_ingredients method
+        ingredients (list): list of ingredient tuples, in the format returned
+            by the parse_ingredients method. The constructor also accepts a
+            string of ingredients, which is parsed with parse_ingredients.
         instructions (str): string containing all instructions for how to
             cook recipe
+        version (int): number which changes every time the recipe is
+            modified, so that anything derived from the recipe (like its
+            rendered text) can tell when it is out of date
     '''
 
+    # shared between all recipes, so that a recipe which is deleted and then
+    # re-added with the same title never reuses an old version number
+    _versions = count()
+
     def __init__(self, title, ingredients, instructions, tags=None, notes=None):
         self.title = title
-        self.ingredients = Recipe.parse_ingredients(ingredients)
+        if isinstance(ingredients, str):
+            self.ingredients = Recipe.parse_ingredients(ingredients)
+        else:
+            self.ingredients = list(ingredients)
         self.instructions = instructions.strip()
 
         if not tags:
@@ -42,6 +83,15 @@ class Recipe:
         else:
             self.notes = notes
 
+        self.version = next(Recipe._versions)
+
+    def mark_changed(self):
+        '''
+        Gives the recipe a new version number. Should be called whenever the
+        recipe's ingredients, instructions, tags, or notes are modified.
+        '''
+        self.version = next(Recipe._versions)
+
     def __str__(self):
         recipe_string = self.title + '\n--------\n'
         for ing in self.ingredients:
@@ -55,19 +105,36 @@ class Recipe:
         Returns the filename where the data for this recipe should be saved.
         Also creates any needed directories that may not exist.
 
+        Recipes are spread between 256 subdirectories, named by the first two
+        hex digits of a hash of the title, so that no single directory gets
+        too big. The hash is also added to the filename, so that titles which
+        only differ in punctuation don't end up in the same file.
+
         Args:
             directory (str or None): if None, the directory will be autofilled
                 to "Recipes". Otherwise, it is saved in the format of
-                <directory>/<title>.txt
+                <directory>/<shard>/<title>-<hash>.txt
         '''
         if not directory:
-            if not os.path.exists('Recipes'):
-                os.makedirs('Recipes')
-            return f'Recipes/{self.title.replace(" ", "_") + ".txt"}'
-        else:
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-            return f'{directory}/{self.title.replace(" ", "_") + ".txt"}'
+            directory = 'Recipes'
+
+        digest = hashlib.sha1(self.title.encode('utf-8')).hexdigest()
+        shard_directory = f'{directory}/{digest[:2]}'
+        Recipe._make_directory(shard_directory)
+
+        safe_title = re.sub(r'[^\w\-]+', '_', self.title)[:80]
+        return f'{shard_directory}/{safe_title}-{digest[:8]}.txt'
+
+    # directories that are already known to exist, so they don't need to be
+    # checked again on every save
+    _made_directories = set()
+
+    @staticmethod
+    def _make_directory(directory):
+        abs_directory = os.path.join(PACKAGE_DIR, directory)
+        if abs_directory not in Recipe._made_directories:
+            os.makedirs(abs_directory, exist_ok=True)
+            Recipe._made_directories.add(abs_directory)
 
     def save_to_file(self, **kwargs):
         """
@@ -75,10 +142,11 @@ class Recipe:
         directory this file is saved in. Can also take any kwargs taken by
         get_filename()
         """
-        old_cwd = os.getcwd()
-        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        # this doesn't change directory like the other methods do, since it
+        # may be called from the autosave thread while other code is running
+        filename = os.path.join(PACKAGE_DIR, self.get_filename(**kwargs))
 
-        with open(self.get_filename(**kwargs), 'w') as f:
+        with open(filename, 'w') as f:
             f.write(f"{self.title}\n\n")
 
             f.write(self.get_ingredients())
@@ -96,9 +164,6 @@ class Recipe:
                 f.write('\n'.join(notes_strings) + '\n')
             f.write('--------\n')
 
-
-        os.chdir(old_cwd)
-
     def get_ingredients(self):
         """
         Returns the ingredients of the recipe in a nicely formatted string.
@@ -194,9 +259,10 @@ class Recipe:
         number = float(split.pop(0))
 
         #parse second to unit
+        unit_conversions = get_unit_conversions()
         unit = split.pop(0)
         name = ''
-        if unit in unit_conversions.keys():
+        if unit in unit_conversions:
             unit = unit_conversions[unit]
         else:
             name = unit
@@ -210,6 +276,40 @@ class Recipe:
         return (number, unit, name)
 
 
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def normalise_name(name):
+        """
+        Returns a normalised form of an ingredient name, so that names written
+        slightly differently can be matched to each other. Lowercases the
+        name, removes anything in parentheses and any punctuation, and makes
+        the last word singular (i.e. "Tomatoes (ripe)" -> "tomato"). Results are
+        cached, since the same names come up over and over when a cookbook is
+        indexed.
+
+        Args:
+            name (str): ingredient name, as in the third element of the
+                tuples returned by parse_ingredients
+
+        Returns:
+            normalised_name (str): normalised version of the name
+        """
+        name = re.sub(r'\(.*?\)', ' ', name.lower())
+        words = re.sub(r'[^\w\s]', ' ', name).split()
+        if not words:
+            return ''
+
+        last = words[-1]
+        if len(last) > 3 and last.endswith('ies'):
+            last = last[:-3] + 'y'
+        elif len(last) > 3 and last.endswith(('oes', 'ches', 'shes', 'sses', 'xes')):
+            last = last[:-2]
+        elif len(last) > 2 and last.endswith('s') and not last.endswith(('ss', 'us')):
+            last = last[:-1]
+        words[-1] = last
+
+        return ' '.join(words)
+
     @staticmethod
     def parse_ingredients(ingredients_raw):
         """
@@ -224,6 +324,7 @@ class Recipe:
             ingredients (list): list of tuples containing ingredient data
                 to store.
         """
+        unit_conversions = get_unit_conversions()
         ingredients_raw = ingredients_raw.strip()
         separated_ingredients = re.split(r',\s*|\s*\n\s*', ingredients_raw)
         ingredients = []
@@ -247,7 +348,7 @@ class Recipe:
 
             # parse units
             unit=''
-            if split[0] in unit_conversions.keys():
+            if split and split[0] in unit_conversions:
                 unit =  unit_conversions[split[0]]
                 del split[0]
 
@@ -317,16 +418,22 @@ class Recipe:
             except:
                 pass
         elif len(fraction_string.split('-')) > 1:
-            split_fraction = fraction_string.split('-')
-            whole_number = int(split_fraction[0])
-            remainder = split_fraction[1]
+            try:
+                split_fraction = fraction_string.split('-')
+                whole_number = int(split_fraction[0])
+                remainder = split_fraction[1]
+            except:
+                return fraction_string
         else:
             whole_number = 0
             remainder = fraction_string
 
         if len(remainder.split('/')) == 2:
-            num, denom = [int(x) for x in remainder.split('/')]
-            return whole_number + num / denom
+            try:
+                num, denom = [int(x) for x in remainder.split('/')]
+                return whole_number + num / denom
+            except:
+                return fraction_string
         else:
             try:
                 return float(fraction_string)
@@ -385,4 +492,4 @@ if __name__=='__main__':
     parsed = Recipe.parse_ingredients("1 egg\nA whole piece of ginger\n25 c flour")
     print(Recipe.unparse_ingredients(parsed))
 
-    print(unit_conversions.keys())
+    print(get_unit_conversions().keys())
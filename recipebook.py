@@ -1,8 +1,17 @@
 from cookbook import Cookbook
-import os
+from recipe import Recipe
+from storage import TextFileStorage, SQLiteStorage
+from autosave import AutoSaver
+from export import export
+from pantry import Pantry, recipe_names
+from mealplan import MealPlan, MEALS, week_start
+from datetime import datetime, timedelta
+import argparse
 import tkinter as tk
 from tkinter import scrolledtext
 from tkinter import messagebox
+from tkinter import filedialog
+from tkinter import simpledialog
 import logging
 logging.basicConfig(level=logging.INFO)
 
@@ -27,23 +36,50 @@ class AutoScrollbar(tk.Scrollbar):
 
 class GUI:
 
-    def __init__(self, directory="Recipes"):
+    def __init__(self, directory="Recipes", backend="text", autosave_delay=2.0):
+        """
+        Args:
+            directory (str): where the recipes are saved, relative to the
+                directory containing this file. For the "sqlite" backend, the
+                recipes are saved in the database file <directory>.db
+            backend (str): "text" to save each recipe in its own text file,
+                or "sqlite" to save them all in one SQLite database
+            autosave_delay (float): seconds after a change before it is saved
+                in the background
+        """
 
-        # look for previously saved recipes in the Recipes folder,
-        # if there are none, just create a new Cookbook object
+        # look for previously saved recipes in the Recipes folder (or
+        # database). if there are none, this will be an empty Cookbook
         self.directory = directory
-        old_cwd = os.getcwd()
-        os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-        if os.path.exists(self.directory):
-            self.ckbk = Cookbook.read_from_dir(self.directory)
+        if backend == 'sqlite':
+            storage = SQLiteStorage(directory + '.db')
         else:
-            self.ckbk = Cookbook()
+            storage = TextFileStorage(directory)
+        self.ckbk = Cookbook.load(storage)
 
-        os.chdir(old_cwd)
+        # changes are saved in a background thread as they are made. any
+        # recipes still in an old storage layout are moved over in the
+        # background too.
+        self.autosaver = AutoSaver(self.ckbk, delay=autosave_delay)
+        for title in storage.needs_saving():
+            self.autosaver.save(title)
+
+        # perishable ingredients which have been bought, for reminding the
+        # user to use them before they go off
+        self.pantry = Pantry.load()
+        self._reminder_job = None
+
+        # which recipes are planned for which days, see mealplan.py
+        self.meal_plan = MealPlan.load(self.ckbk)
 
         self.main_window = None
 
+        # rendered text of recently shown recipes, keyed by title. each entry
+        # is (version, recipe_text, recipe_tag_text), and is only used if the
+        # version still matches the recipe's current version
+        self._render_cache = {}
+        self._prefetch_job = None
+
         '''
         for i in range(100):
             self.ckbk.add(f"Recipe {i+1}", f"1 c flour, {i+1} tbsp water", "Make paste. Cook on stovetop until not sticky.")
@@ -64,6 +100,27 @@ class GUI:
         self.main_window.columnconfigure(0, weight=1, minsize=200)
         self.main_window.columnconfigure(1, weight=4, minsize=500)
 
+        #—————————————————————————————menu bar——————————————————————————————————
+        menu_bar = tk.Menu(master=self.main_window)
+        file_menu = tk.Menu(master=menu_bar, tearoff=0)
+        file_menu.add_command(label='Export All Recipes...',
+            command=lambda: self._export_window(shown_only=False))
+        file_menu.add_command(label='Export Shown Recipes...',
+            command=lambda: self._export_window(shown_only=True))
+        menu_bar.add_cascade(label='File', menu=file_menu)
+        pantry_menu = tk.Menu(master=menu_bar, tearoff=0)
+        pantry_menu.add_command(label='Add Purchase...',
+            command=self._add_purchase_window)
+        pantry_menu.add_command(label='Used Up...',
+            command=self._used_up_window)
+        pantry_menu.add_command(label='Expiring Soon',
+            command=lambda: self._show_expiring(self.pantry.expiring()))
+        menu_bar.add_cascade(label='Pantry', menu=pantry_menu)
+        plan_menu = tk.Menu(master=menu_bar, tearoff=0)
+        plan_menu.add_command(label='Meal Plan...',
+            command=self._meal_plan_window)
+        menu_bar.add_cascade(label='Plan', menu=plan_menu)
+        self.main_window.config(menu=menu_bar)
 
         #—————————————————————recipe list sidebar———————————————————————————————
         sidebar = tk.Frame(master=self.main_window)
@@ -81,6 +138,10 @@ class GUI:
         # changed the list will update
         self.search_text = tk.StringVar()
 
+        # stringvar holding how the recipe list is sorted, chosen from the
+        # menu at the bottom of the sidebar
+        self.sort_order = tk.StringVar(value='Default Order')
+
         searchbar = tk.Entry(master=sidebar, textvariable=self.search_text,
                 highlightthickness=0, borderwidth=4, relief=tk.FLAT)
 
@@ -104,6 +165,60 @@ class GUI:
 
         searchbar.grid(row=0, column=0, columnspan=2, sticky='nsew')
 
+        #------------------------search suggestions-----------------------------
+
+        # dropdown under the searchbar, suggesting titles, tags and ingredients
+        # that start with what has been typed so far
+        suggestion_list = tk.Listbox(master=sidebar, borderwidth=1,
+            relief=tk.SOLID, highlightthickness=0, selectmode=tk.SINGLE,
+            activestyle='none')
+
+        def hide_suggestions(event=None):
+            suggestion_list.place_forget()
+
+        def update_suggestions(var, idx, mode):
+            prefix = self.search_text.get()
+            if prefix.strip() in ('', 'Search...'):
+                hide_suggestions()
+                return
+
+            suggestions = self.ckbk.complete(prefix)
+            if not suggestions or [s.lower() for s in suggestions] == [prefix.lower()]:
+                hide_suggestions()
+                return
+
+            suggestion_list.delete(0, tk.END)
+            for suggestion in suggestions:
+                suggestion_list.insert(tk.END, suggestion)
+            suggestion_list.config(height=len(suggestions))
+            suggestion_list.place(in_=searchbar, relx=0, rely=1, relwidth=1)
+            suggestion_list.lift()
+
+        def choose_suggestion(event):
+            selected = suggestion_list.curselection()
+            if not selected:
+                return
+            self.search_text.set(suggestion_list.get(selected[0]))
+            hide_suggestions()
+            searchbar.focus_set()
+            searchbar.icursor(tk.END)
+
+        def focus_suggestions(event):
+            if not suggestion_list.winfo_ismapped():
+                return
+            suggestion_list.focus_set()
+            suggestion_list.selection_clear(0, tk.END)
+            suggestion_list.selection_set(0)
+            suggestion_list.activate(0)
+            return 'break'
+
+        self.search_text.trace_add('write', update_suggestions)
+        suggestion_list.bind('<ButtonRelease-1>', choose_suggestion)
+        suggestion_list.bind('<Return>', choose_suggestion)
+        suggestion_list.bind('<Escape>', hide_suggestions)
+        searchbar.bind('<Down>', focus_suggestions)
+        searchbar.bind('<Escape>', hide_suggestions)
+
         #-----------------------------recipe list-------------------------------
 
         # recipe listbox ...
@@ -126,6 +241,7 @@ class GUI:
         # configure recipe_list so that it will update when the searchbar
         # is changed
         self.search_text.trace_add('write', self._update_recipe_list)
+        self.sort_order.trace_add('write', self._update_recipe_list)
 
         self._update_recipe_list(0,0,0)
 
@@ -135,6 +251,12 @@ class GUI:
             highlightthickness=0)
         add_button.grid(row=3, column=0, columnspan=2, sticky='nsew')
 
+        # menu for choosing the order of the recipe list
+        sort_menu = tk.OptionMenu(sidebar, self.sort_order, 'Default Order',
+            'Last Cooked')
+        sort_menu.config(borderwidth=0, highlightthickness=0)
+        sort_menu.grid(row=4, column=0, columnspan=2, sticky='nsew')
+
         rc_options = tk.Menu(master=sidebar, tearoff=0)
 
         #---------------------------edit and delete options---------------------
@@ -213,38 +335,104 @@ class GUI:
             title_to_show = self.recipe_list.get(idx_to_show)
             recipe_to_show = self.ckbk.find_by_title(title_to_show)
 
-            self._show_recipe_in_main(recipe_to_show)
+            self.recipe_list.focus_set()
+            self._show_recipe_in_main(recipe_to_show, idx_to_show)
 
         self.recipe_list.bind('<Button-1>', select_recipe)
+        self.recipe_list.bind('<FocusIn>', hide_suggestions)
 
-        self._show_recipe_in_main(self.ckbk.recipes[0])
+        # arrow keys move the selection up and down the list, showing each
+        # recipe as it is selected
+        def browse_recipes(event, step):
+            selected = self.recipe_list.curselection()
+            idx_to_show = selected[0] + step if selected else 0
+            if not 0 <= idx_to_show < self.recipe_list.size():
+                return 'break'
+
+            self.recipe_list.selection_clear(0, tk.END)
+            self.recipe_list.selection_set(idx_to_show)
+            self.recipe_list.activate(idx_to_show)
+            self.recipe_list.see(idx_to_show)
+
+            title_to_show = self.recipe_list.get(idx_to_show)
+            self._show_recipe_in_main(self.ckbk.find_by_title(title_to_show),
+                idx_to_show)
+            return 'break'
+
+        self.recipe_list.bind('<Up>', lambda e: browse_recipes(e, -1))
+        self.recipe_list.bind('<Down>', lambda e: browse_recipes(e, 1))
+
+        self._show_recipe_in_main(self.ckbk.recipes[0], 0)
         self.recipe_list.select_set(0)
 
+        # remind about anything in the pantry that is about to go off
+        self._schedule_reminder()
+
+        # build the index used to spot duplicates while the window is idle
+        self.main_window.after_idle(self._build_similarity_index)
+
         #————————————————————————main loop——————————————————————————————————————
         self.main_window.mainloop()
 
-    def _show_recipe_in_main(self, recipe_to_show):
-
+    def _show_recipe_in_main(self, recipe_to_show, idx=None):
+        """
+        Shows a recipe in the main panel. If idx (the recipe's position in the
+        recipe list) is given, the recipes just above and below it are
+        rendered ahead of time once the window is idle, so that moving through
+        the list with the arrow keys doesn't have to wait on rendering.
+        """
         self.title_label.config(text=recipe_to_show.title)
 
-        # format recipe text in main body
-        recipe_text = ''
-        recipe_text += recipe_to_show.get_ingredients()
-        recipe_text += '----------------------------------------\n'
-        recipe_text += recipe_to_show.instructions
+        recipe_text, recipe_tag_text = self._render_recipe(recipe_to_show)
+
         self.recipe_body.config(state='normal')
         self.recipe_body.delete('1.0', tk.END)
-        self.recipe_body.insert('1.0', str(recipe_text))
+        self.recipe_body.insert('1.0', recipe_text)
         self.recipe_body.config(state='disabled')
 
+        self.recipe_tags.config(text=recipe_tag_text)
+
+        if idx is not None:
+            if self._prefetch_job is not None:
+                self.main_window.after_cancel(self._prefetch_job)
+            self._prefetch_job = self.main_window.after_idle(
+                self._prefetch_neighbours, idx)
+
+    def _render_recipe(self, recipe):
+        """
+        Returns the text shown in the main panel body and the tags section for
+        a recipe, as a tuple (recipe_text, recipe_tag_text). Results are
+        cached until the recipe's version changes.
+        """
+        cached = self._render_cache.get(recipe.title)
+        if cached and cached[0] == recipe.version:
+            return cached[1:]
+
+        # format recipe text in main body
+        recipe_text = ''
+        recipe_text += recipe.get_ingredients()
+        recipe_text += '----------------------------------------\n'
+        recipe_text += recipe.instructions
 
         # format recipe tags into the tags section
-        recipe_tag_text = 'Tags: '
-        for tag in recipe_to_show.tags:
-            recipe_tag_text += tag +', '
-        if recipe_tag_text != "Tags: ":
-            recipe_tag_text = recipe_tag_text[:-2]
-        self.recipe_tags.config(text=str(recipe_tag_text))
+        recipe_tag_text = 'Tags: ' + ', '.join(recipe.tags)
+
+        self._render_cache[recipe.title] = (recipe.version, recipe_text,
+            recipe_tag_text)
+        return recipe_text, recipe_tag_text
+
+    def _prefetch_neighbours(self, idx):
+        """
+        Renders the recipes directly above and below position idx in the
+        recipe list, so they are already cached when they are shown.
+        """
+        self._prefetch_job = None
+        for neighbour in (idx - 1, idx + 1):
+            if not 0 <= neighbour < self.recipe_list.size():
+                continue
+            recipe = self.ckbk.find_by_title(self.recipe_list.get(neighbour))
+            if recipe:
+                self._render_recipe(recipe)
 
 
     def _load_all_recipes(self):
@@ -266,11 +454,260 @@ class GUI:
         fil = self.search_text.get()
         if fil =='Search...': fil=''
         recipes_to_show = self.ckbk.find(fil)
+        if self.sort_order.get() == 'Last Cooked':
+            recipes_to_show = self.ckbk.sort_by_last_cooked(recipes_to_show)
 
         self.recipe_list.delete(0, tk.END)
         for recipe in recipes_to_show:
             self.recipe_list.insert(tk.END, recipe.title)
 
+    def _export_window(self, shown_only=False):
+        """
+        Asks for a file to export recipes to, then writes them to it as HTML
+        or PDF (depending on the file's extension). If shown_only is True,
+        only the recipes currently in the recipe list are exported.
+        """
+        filename = filedialog.asksaveasfilename(parent=self.main_window,
+            title='Export Recipes', defaultextension='.pdf',
+            filetypes=[('PDF', '*.pdf'), ('HTML', '*.html')])
+        if not filename:
+            return
+
+        if shown_only:
+            titles = self.recipe_list.get(0, tk.END)
+            recipes = [self.ckbk.find_by_title(t) for t in titles]
+            recipes = [r for r in recipes if r is not None]
+        else:
+            recipes = sorted(self.ckbk.recipes, key=lambda r: r.title.lower())
+
+        try:
+            export(recipes, filename)
+        except OSError as e:
+            logging.exception(f"Could not export to {filename}")
+            messagebox.showerror(title="Export Failed", message=str(e),
+                parent=self.main_window)
+        else:
+            logging.info(f"Exported {len(recipes)} recipes to {filename}")
+
+    def _build_similarity_index(self):
+        """
+        Adds a batch of recipes to the cookbook's similarity index, then
+        schedules the next batch, so that the index is built without ever
+        freezing the window for long.
+        """
+        if not self.ckbk.build_similarity_index(batch_size=100):
+            self.main_window.after(10, self._build_similarity_index)
+
+    def _schedule_reminder(self):
+        """
+        Sets a timer for when the next pantry reminder is due. The pantry keeps
+        its reminders in a heap, so finding the next one is cheap. Long waits
+        are checked again every hour, in case the computer has been asleep.
+        """
+        if self._reminder_job is not None:
+            self.main_window.after_cancel(self._reminder_job)
+            self._reminder_job = None
+
+        remind_at = self.pantry.next_reminder()
+        if remind_at is None:
+            return
+        delay = (remind_at - datetime.now()).total_seconds()
+        delay = min(max(delay, 0), 3600)
+        self._reminder_job = self.main_window.after(int(delay * 1000),
+            self._show_reminders)
+
+    def _show_reminders(self):
+        """
+        Shows a reminder for any pantry items that are about to go off, then
+        sets the timer for the next one.
+        """
+        self._reminder_job = None
+        due = self.pantry.due()
+        if due:
+            self._show_expiring(due)
+        self._schedule_reminder()
+
+    def _show_expiring(self, expiring):
+        """
+        Shows a list of pantry items which are about to go off, along with some
+        recipes that use them.
+
+        Args:
+            expiring (list): list of (name, expires) tuples
+        """
+        if not expiring:
+            messagebox.showinfo(title="Pantry", message="Nothing in the pantry \
+is about to go off.", parent=self.main_window)
+            return
+
+        lines = [f"{name}: use by {expires.strftime('%a %d %b')}"
+            for name, expires in expiring]
+        suggestions = self.ckbk.recipes_using(
+            recipe_names(name for name, _ in expiring))
+        if suggestions:
+            lines.append('\nRecipes that use them:')
+            lines += [f"{rec.title} ({', '.join(sorted(used))})"
+                for rec, used in suggestions[:10]]
+        messagebox.showinfo(title="Use These Soon", message='\n'.join(lines),
+            parent=self.main_window)
+
+    def _add_purchase_window(self):
+        """
+        Asks for an ingredient that has been bought, and adds it to the pantry.
+        If it isn't in the shelf life table, asks how many days it keeps.
+        """
+        name = simpledialog.askstring("Add Purchase", "Ingredient bought:",
+            parent=self.main_window)
+        if not name or not name.strip():
+            return
+
+        expires = self.pantry.add(name)
+        if expires is None:
+            days = simpledialog.askinteger("Add Purchase", f"How many days \
+does {name} keep?", minvalue=1, parent=self.main_window)
+            if days is None:
+                return
+            expires = self.pantry.add(name, days=days)
+
+        self.pantry.save()
+        logging.info(f"Added {name} to the pantry, expires {expires:%Y-%m-%d}")
+        self._schedule_reminder()
+
+    def _used_up_window(self):
+        """
+        Asks for an ingredient that has been used up, and removes it from the
+        pantry.
+        """
+        name = simpledialog.askstring("Used Up", "Ingredient used up:",
+            parent=self.main_window)
+        if not name or not name.strip():
+            return
+        self.pantry.remove(name)
+        self.pantry.save()
+        self._schedule_reminder()
+
+    def _meal_plan_window(self):
+        """
+        Opens a window showing the meal plan for a week, with a button for
+        each meal to choose what to cook, and the week's shopping list and
+        tags beside it. Clicking on a day shows that day's prep list instead.
+        The totals are kept up to date by the MealPlan as meals are changed,
+        so only the changed meal and the totals are redrawn after each edit.
+        """
+        pw = tk.Toplevel(self.main_window)
+        pw.title("Meal Plan")
+        pw.columnconfigure(len(MEALS) + 1, weight=1, minsize=250)
+        pw.rowconfigure(8, weight=1)
+
+        shown = {'week': week_start(datetime.now()), 'day': None}
+
+        week_label = tk.Label(master=pw)
+        summary_text = scrolledtext.ScrolledText(master=pw, wrap=tk.WORD,
+            width=40, height=20, borderwidth=0, highlightthickness=0)
+
+        day_buttons = []
+        meal_buttons = {}
+
+        def slot_text(date, meal):
+            planned = self.meal_plan.slots.get((date, meal))
+            if planned is None:
+                return '+'
+            title, multiplier = planned
+            return title if multiplier == 1 else f"{title} (x{multiplier:g})"
+
+        def render_summary():
+            if shown['day'] is not None:
+                heading = shown['day'].strftime('Prep for %A %d %B')
+                body = self.meal_plan.prep_list(shown['day'])
+            else:
+                totals = self.meal_plan.week_totals(shown['week'])
+                heading = 'Shopping List'
+                body = totals.shopping_list()
+                if totals.tags:
+                    body += '\nTags:\n' + '\n'.join(f"{tag}: {n}" for tag, n
+                        in sorted(totals.tags.items(), key=lambda t: -t[1]))
+            summary_text.config(state='normal')
+            summary_text.delete('1.0', tk.END)
+            summary_text.insert(tk.END, heading + '\n\n' + body)
+            summary_text.config(state='disabled')
+
+        def render_week():
+            week = shown['week']
+            week_label.config(text=week.strftime('Week of %d %B %Y'))
+            for i, day_button in enumerate(day_buttons):
+                date = week + timedelta(days=i)
+                day_button.config(text=date.strftime('%a %d'))
+                for meal in MEALS:
+                    meal_buttons[(i, meal)].config(text=slot_text(date, meal))
+            render_summary()
+
+        def change_week(step):
+            shown['week'] += timedelta(days=7 * step)
+            shown['day'] = None
+            render_week()
+
+        def show_day(i):
+            date = shown['week'] + timedelta(days=i)
+            shown['day'] = None if shown['day'] == date else date
+            render_summary()
+
+        def edit_slot(i, meal):
+            date = shown['week'] + timedelta(days=i)
+            current = self.meal_plan.slots.get((date, meal), ('', 1))
+            title = simpledialog.askstring("Meal Plan", f"Recipe for \
+{meal.lower()} on {date:%A} (leave empty to clear):",
+                initialvalue=current[0], parent=pw)
+            if title is None:
+                return
+
+            if not title.strip():
+                self.meal_plan.clear(date, meal)
+            elif self.ckbk.find_by_title(title) is None:
+                messagebox.showwarning(title="No Such Recipe",
+                    message=f"There is no recipe called {title}.", parent=pw)
+                return
+            else:
+                multiplier = simpledialog.askfloat("Meal Plan", "How many \
+times to make it (i.e. 2 to double it):", initialvalue=current[1],
+                    minvalue=0.01, parent=pw)
+                if multiplier is None:
+                    return
+                self.meal_plan.set(date, meal, title, multiplier)
+
+            meal_buttons[(i, meal)].config(text=slot_text(date, meal))
+            render_summary()
+
+        tk.Button(master=pw, text='<', borderwidth=0,
+            command=lambda: change_week(-1)).grid(row=0, column=0, sticky='nsew')
+        week_label.grid(row=0, column=1, columnspan=len(MEALS) - 1, sticky='nsew')
+        tk.Button(master=pw, text='>', borderwidth=0,
+            command=lambda: change_week(1)).grid(row=0, column=len(MEALS),
+            sticky='nsew')
+
+        for j, meal in enumerate(MEALS):
+            tk.Label(master=pw, text=meal).grid(row=1, column=j + 1,
+                sticky='nsew')
+        for i in range(7):
+            day_button = tk.Button(master=pw, borderwidth=0,
+                command=lambda i=i: show_day(i))
+            day_button.grid(row=i + 2, column=0, sticky='nsew')
+            day_buttons.append(day_button)
+            for j, meal in enumerate(MEALS):
+                meal_button = tk.Button(master=pw, width=18, borderwidth=0,
+                    wraplength=140, command=lambda i=i, meal=meal: edit_slot(i, meal))
+                meal_button.grid(row=i + 2, column=j + 1, sticky='nsew')
+                meal_buttons[(i, meal)] = meal_button
+
+        summary_text.grid(row=0, column=len(MEALS) + 1, rowspan=9,
+            sticky='nsew')
+
+        def close_plan():
+            self.meal_plan.save()
+            pw.destroy()
+        pw.protocol("WM_DELETE_WINDOW", close_plan)
+
+        render_week()
+
     def _add_new_recipe_window(self):
         """
         Displays popup window which prompts user for information about recipe
@@ -321,7 +758,22 @@ cookbook. Please choose a different title and try again.")
             instr_to_add = instructions_text.get('1.0', tk.END)
             tags_to_add = tags_entry.get()
             tags_to_add = tags_to_add.split(', ')
-            self.ckbk.add(title_to_add, ings_to_add, instr_to_add, tags=tags_to_add)
+
+            # if the recipe is nearly the same as one already in the cookbook,
+            # check that the user really wants to add it
+            new_recipe = Recipe(title_to_add, ings_to_add, instr_to_add,
+                tags=tags_to_add)
+            # the similarity index is built in the background after
+            # startup; until it is done, don't wait for it
+            similar = []
+            if self.ckbk.similarity_ready:
+                similar = self.ckbk.find_similar(new_recipe, threshold=0.8)
+            if similar and not messagebox.askyesno(title="Possible Duplicate",
+                    message=f"This recipe looks very similar to \
+\"{similar[0][0].title}\", which is already in the cookbook. Add it anyway?"):
+                return
+
+            self.ckbk.add_recipe(new_recipe)
 
             nrw.destroy()
 
@@ -434,6 +886,7 @@ cookbook. Please choose a different title and try again.")
 
         def really_delete():
             self.ckbk.delete_recipe(title)
+            self._render_cache.pop(title, None)
 
             dw.destroy()
 
@@ -456,15 +909,31 @@ cookbook. Please choose a different title and try again.")
 
     def _save_and_close(self):
         """
-        Function which is called when the tkinter window is closed. Writes
-        all of the recipes in the cookbook to files in a directory for use
-        later.
+        Function which is called when the tkinter window is closed. Recipes
+        are saved as they are changed, so this just waits for the autosave
+        thread to write any changes it hasn't got to yet, and warns about any
+        that couldn't be written.
         """
-
-        for rec in self.ckbk.recipes:
-            rec.save_to_file()
+        self.main_window.withdraw()
+        self.meal_plan.save()
+        unsaved = self.autosaver.close()
+        self.ckbk.storage.close()
+
+        if unsaved:
+            self.main_window.deiconify()
+            listed = '\n'.join(unsaved[:20])
+            if len(unsaved) > 20:
+                listed += f'\n...and {len(unsaved) - 20} more'
+            messagebox.showerror(title="Changes Not Saved", message="The \
+changes to these recipes could not be saved (see the log for details):\n\n" +
+                listed, parent=self.main_window)
         self.main_window.destroy()
 
 if __name__ == '__main__':
-    g = GUI()
+    arg_parser = argparse.ArgumentParser(description='Recipe Book')
+    arg_parser.add_argument('--sqlite', action='store_true',
+        help='store recipes in an SQLite database instead of text files')
+    args = arg_parser.parse_args()
+
+    g = GUI(backend='sqlite' if args.sqlite else 'text')
     g.run()
@@ -0,0 +1,159 @@
+import random
+import re
+from hashlib import blake2b
+from recipe import Recipe
+
+class SimilarityIndex:
+    '''
+    Finds recipes that are similar to each other using MinHash signatures and
+    locality sensitive hashing (LSH), so that near duplicates can be found
+    without comparing every pair of recipes.
+
+    Each recipe is turned into a set of shingles: its normalised ingredient
+    names and every run of three words in its instructions. The MinHash
+    signature of that set estimates the Jaccard similarity between recipes.
+    Signatures are split into bands, and recipes with an identical band land in
+    the same bucket, so only recipes sharing a bucket are ever compared.
+
+    Attributes:
+        num_perm (int): number of hash functions in each signature
+        bands (int): number of bands each signature is split into. With
+            num_perm // bands rows per band, pairs are likely to become
+            candidates when their similarity is above about
+            (1 / bands) ** (bands / num_perm).
+        signatures (dict): maps each recipe id to its signature
+        buckets (list): one dictionary per band, mapping the band's values to
+            the set of recipe ids with those values
+    '''
+    def __init__(self, num_perm=64, bands=16, seed=1):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        # each hash function is the shingle's 64 bit hash xor-ed with a
+        # different random mask, which is much cheaper in python than
+        # computing a separate hash per function
+        rng = random.Random(seed)
+        self._masks = [rng.getrandbits(64) for _ in range(num_perm)]
+
+        self.signatures = {}
+        self.buckets = [{} for _ in range(bands)]
+
+    @staticmethod
+    def shingles(recipe):
+        '''
+        Returns the set of shingles of a recipe, built from its normalised
+        ingredient names and the three word runs in its instructions.
+        '''
+        shingles = {'i:' + Recipe.normalise_name(ing[2])
+            for ing in recipe.ingredients}
+        shingles.discard('i:')
+
+        words = re.findall(r'\w+', recipe.instructions.lower())
+        for i in range(len(words) - 2):
+            shingles.add('w:' + ' '.join(words[i:i+3]))
+        return shingles
+
+    def signature(self, recipe):
+        '''
+        Returns the MinHash signature of a recipe as a tuple of num_perm ints,
+        or None if the recipe has nothing to build a signature from.
+        '''
+        hashes = [int.from_bytes(blake2b(s.encode('utf-8'),
+            digest_size=8).digest(), 'little')
+            for s in SimilarityIndex.shingles(recipe)]
+        if not hashes:
+            return None
+        return tuple(min(map(mask.__xor__, hashes)) for mask in self._masks)
+
+    def _bands(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band*self.rows:(band+1)*self.rows]
+
+    def add(self, recipe_id, recipe):
+        '''
+        Adds a recipe to the index.
+        '''
+        signature = self.signature(recipe)
+        if signature is None:
+            return
+        self.signatures[recipe_id] = signature
+        for band, key in self._bands(signature):
+            self.buckets[band].setdefault(key, set()).add(recipe_id)
+
+    def remove(self, recipe_id):
+        '''
+        Removes a recipe from the index.
+        '''
+        signature = self.signatures.pop(recipe_id, None)
+        if signature is None:
+            return
+        for band, key in self._bands(signature):
+            bucket = self.buckets[band][key]
+            bucket.discard(recipe_id)
+            if not bucket:
+                del self.buckets[band][key]
+
+    @staticmethod
+    def estimate(sig_a, sig_b):
+        '''
+        Returns the estimated Jaccard similarity of two signatures, i.e. the
+        fraction of positions where they agree.
+        '''
+        return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+    def similar(self, signature, threshold=0.5):
+        '''
+        Finds the indexed recipes whose estimated similarity to a signature is
+        at least threshold.
+
+        Args:
+            signature (tuple): signature to compare against, from
+                SimilarityIndex.signature
+            threshold (float): smallest similarity to return, from 0 to 1
+
+        Returns:
+            similar (list): list of (recipe_id, similarity) tuples, most
+                similar first
+        '''
+        if signature is None:
+            return []
+        candidates = set()
+        for band, key in self._bands(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        similar = []
+        for recipe_id in candidates:
+            sim = SimilarityIndex.estimate(signature, self.signatures[recipe_id])
+            if sim >= threshold:
+                similar.append((recipe_id, sim))
+        similar.sort(key=lambda s: (-s[1], s[0]))
+        return similar
+
+    def duplicate_pairs(self, threshold=0.8):
+        '''
+        Finds every pair of indexed recipes whose estimated similarity is at
+        least threshold. Only recipes sharing an LSH bucket are compared.
+
+        Returns:
+            pairs (list): list of (recipe_id_a, recipe_id_b, similarity)
+                tuples with recipe_id_a < recipe_id_b, most similar first
+        '''
+        checked = set()
+        pairs = []
+        for band_buckets in self.buckets:
+            for bucket in band_buckets.values():
+                if len(bucket) < 2:
+                    continue
+                ids = sorted(bucket)
+                for i, id_a in enumerate(ids):
+                    for id_b in ids[i+1:]:
+                        if (id_a, id_b) in checked:
+                            continue
+                        checked.add((id_a, id_b))
+                        sim = SimilarityIndex.estimate(self.signatures[id_a],
+                            self.signatures[id_b])
+                        if sim >= threshold:
+                            pairs.append((id_a, id_b, sim))
+        pairs.sort(key=lambda p: (-p[2], p[0], p[1]))
+        return pairs
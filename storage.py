@@ -0,0 +1,483 @@
+'''
+Storage backends for saving and loading a Cookbook's recipes. Every backend
+has the same methods (load, save, save_many, delete, close, needs_saving), so
+the Cookbook doesn't need to know how its recipes are stored.
+
+    TextFileStorage: one text file per recipe, in the format described in
+        recipe.py, in a directory split into subdirectories with a manifest
+    SQLiteStorage: a single SQLite database file, with tables for recipes,
+        ingredients, tags and notes, and a full text search index
+
+Backends can be used from more than one thread (i.e. by the autosave thread,
+see autosave.py), but their methods are run one at a time.
+
+Cookbooks can be converted between the two with convert(), or from the
+command line:
+    python storage.py to-sqlite Recipes Recipes.db
+    python storage.py to-text Recipes.db Recipes
+'''
+from recipe import Recipe, PACKAGE_DIR
+from manifest import Manifest, MANIFEST_NAME
+from datetime import datetime
+import argparse
+import functools
+import logging
+import os
+import sqlite3
+import threading
+
+def _locked(method):
+    # runs a storage method while holding the storage's lock, so that only
+    # one thread uses the storage at a time
+    @functools.wraps(method)
+    def locked_method(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked_method
+
+class TextFileStorage:
+    '''
+    Stores each recipe in its own text file, at the path given by
+    Recipe.get_filename, and keeps a manifest of which file each recipe is in.
+
+    Attributes:
+        directory (str): directory the recipe files are saved in, relative to
+            the directory containing this file
+        manifest (Manifest): record of which file each recipe is saved in
+    '''
+    def __init__(self, directory='Recipes'):
+        self.directory = directory
+        self.manifest = Manifest.load(directory)
+
+        # the manifest file can only be written once it lists every recipe
+        # file in the directory: if it already exists, if the directory is
+        # new, or once the directory has been loaded (see Manifest)
+        self._manifest_complete = (self.manifest is not None
+            or not os.path.exists(os.path.join(PACKAGE_DIR, directory)))
+        if self.manifest is None:
+            self.manifest = Manifest(directory)
+
+        # titles of recipes whose files aren't where get_filename says they
+        # should be (i.e. from before recipes were split into subdirectories).
+        # they are moved the next time each recipe is saved.
+        self._unmigrated = set()
+        self._lock = threading.RLock()
+
+    @_locked
+    def load(self, search=False):
+        '''
+        Reads in all of the recipes in the directory.
+
+        The files to load are taken from the directory's manifest. If it
+        doesn't have one (because it was saved before manifests existed), the
+        directory is searched for recipe files instead, and they are moved
+        into the current layout as they are saved. The directory is also
+        searched if a file in the manifest is missing (i.e. if it was deleted
+        by hand), and the manifest is rebuilt.
+
+        Args:
+            search (bool): if True, search the directory and rebuild the
+                manifest even if it has one, to pick up recipe files which
+                aren't in the manifest (i.e. ones copied in by hand)
+
+        Returns:
+            recipes (list): list of Recipe objects
+        '''
+        recipes = []
+        directory = os.path.join(PACKAGE_DIR, self.directory)
+        if not os.path.exists(directory):
+            pass
+        elif search:
+            self.manifest = Manifest(self.directory)
+            recipes = self._search_directory(directory)
+            self.manifest.compact()
+        elif os.path.exists(self.manifest.filename):
+            try:
+                for path in self.manifest.paths.values():
+                    recipes.append(Recipe.read_from_file(
+                        os.path.join(directory, path)))
+            except OSError as e:
+                logging.warning(f"Could not read {e.filename}, which is in the "
+                    f"manifest. Searching {self.directory} for recipe files "
+                    "instead.")
+                self.manifest = Manifest(self.directory)
+                recipes = self._search_directory(directory)
+                self.manifest.compact()
+        else:
+            recipes = self._search_directory(directory)
+
+        self._manifest_complete = True
+        return recipes
+
+    def _search_directory(self, directory):
+        # reads in every recipe file under directory, recording them all in
+        # the manifest
+        recipes = []
+        for root, dirs, files in os.walk(directory):
+            for fnam in files:
+                # this is the  mac file that auto-generates to store
+                # display preferences in Finder
+                if fnam == '.DS_Store': continue
+                if fnam in (MANIFEST_NAME, MANIFEST_NAME + '.tmp'): continue
+                path = os.path.join(root, fnam)
+                rec = Recipe.read_from_file(path)
+                recipes.append(rec)
+                self.manifest.record(rec.title,
+                    os.path.relpath(path, directory), append=False)
+                if self._path_for(rec) != self.manifest.paths[rec.title]:
+                    self._unmigrated.add(rec.title)
+        return recipes
+
+    @_locked
+    def needs_saving(self):
+        '''
+        Returns the titles of the recipes that haven't been moved into the
+        current directory layout yet.
+        '''
+        return list(self._unmigrated)
+
+    def save(self, recipe):
+        '''
+        Saves one recipe to its file, and records the file in the manifest.
+        If the recipe was read from a file in the old layout, that file is
+        removed.
+        '''
+        self.save_many([recipe])
+
+    @_locked
+    def save_many(self, recipes):
+        '''
+        Saves a batch of recipes, appending the changes to the manifest all at
+        once.
+        '''
+        old_paths = [self.manifest.paths.get(rec.title) for rec in recipes]
+        new_paths = [self._path_for(rec) for rec in recipes]
+
+        # the files are recorded in the manifest before they are written, so
+        # that if the program stops part way through, the manifest lists a
+        # missing file (which load() recovers from) rather than leaving a
+        # file out
+        self.manifest.record_many(
+            [(rec.title, path) for rec, path in zip(recipes, new_paths)])
+        if (self._manifest_complete
+                and not os.path.exists(self.manifest.filename)):
+            self.manifest.compact()
+        for rec in recipes:
+            rec.save_to_file(directory=self.directory)
+
+        for rec, old_path, new_path in zip(recipes, old_paths, new_paths):
+            self._unmigrated.discard(rec.title)
+            if old_path and old_path != new_path:
+                self._remove_file(old_path)
+
+    @_locked
+    def delete(self, title):
+        '''
+        Removes the file of a recipe, if it was ever saved.
+        '''
+        path = self.manifest.paths.get(title)
+        if path:
+            self._remove_file(path)
+        self.manifest.forget(title)
+        self._unmigrated.discard(title)
+
+    @_locked
+    def close(self):
+        '''
+        Rewrites the manifest without the rows that have been replaced.
+        '''
+        if self._manifest_complete:
+            self.manifest.compact()
+
+    def _path_for(self, recipe):
+        # path of the recipe's file, relative to the recipes directory
+        return os.path.relpath(recipe.get_filename(directory=self.directory),
+            self.directory)
+
+    def _remove_file(self, path):
+        filename = os.path.join(self.manifest.directory, path)
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    instructions TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingredients (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    number REAL NOT NULL,
+    unit TEXT NOT NULL,
+    name TEXT NOT NULL,
+    normalised_name TEXT NOT NULL,
+    PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX IF NOT EXISTS ingredients_by_name
+    ON ingredients(normalised_name);
+CREATE TABLE IF NOT EXISTS tags (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX IF NOT EXISTS tags_by_tag ON tags(tag COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS notes (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX IF NOT EXISTS notes_by_date ON notes(date);
+'''
+
+# full text search index over the text the search bar matches (each recipe's
+# title, ingredient names and tags), with rowid equal to the recipe's id. the
+# trigram tokenizer lets it find text anywhere in a word, like the search bar
+# does, ignoring case.
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS recipes_search
+    USING fts5(title, ingredients, tags, tokenize='trigram');
+'''
+
+# fills the search index in from the other tables, for a database made before
+# it existed
+FTS_REBUILD = '''
+DELETE FROM recipes_search;
+INSERT INTO recipes_search (rowid, title, ingredients, tags)
+    SELECT r.id, r.title,
+        (SELECT group_concat(name, char(10)) FROM ingredients
+            WHERE recipe_id = r.id),
+        (SELECT group_concat(tag, char(10)) FROM tags WHERE recipe_id = r.id)
+    FROM recipes r;
+'''
+
+class SQLiteStorage:
+    '''
+    Stores all of the recipes in a single SQLite database, with separate
+    tables for recipes, ingredients, tags and notes, and an FTS5 full text
+    search index if the installed SQLite supports it (version 3.34 or later,
+    for the trigram tokenizer).
+
+    Attributes:
+        filename (str): path of the database file, relative to the directory
+            containing this file
+        connection (sqlite3.Connection): connection to the database
+        has_fts (bool): whether the full text search index is available
+    '''
+    def __init__(self, filename='Recipes.db'):
+        self.filename = filename
+        self.connection = sqlite3.connect(os.path.join(PACKAGE_DIR, filename),
+            check_same_thread=False)
+        self._lock = threading.RLock()
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+        try:
+            with self.connection:
+                self.connection.executescript(FTS_SCHEMA)
+                indexed = self.connection.execute(
+                    'SELECT count(*) FROM recipes_search').fetchone()[0]
+                total = self.connection.execute(
+                    'SELECT count(*) FROM recipes').fetchone()[0]
+                if indexed != total:
+                    self.connection.executescript(FTS_REBUILD)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            logging.info("SQLite has no FTS5 trigram support, search will be "
+                "slower")
+            self.has_fts = False
+
+    @_locked
+    def load(self):
+        '''
+        Reads in all of the recipes in the database.
+
+        Returns:
+            recipes (list): list of Recipe objects
+        '''
+        cur = self.connection.cursor()
+
+        ingredients = {}
+        for row in cur.execute('SELECT recipe_id, number, unit, name '
+                'FROM ingredients ORDER BY recipe_id, position'):
+            number = row[1] if row[1] else 0
+            ingredients.setdefault(row[0], []).append((number, row[2], row[3]))
+
+        tags = {}
+        for row in cur.execute('SELECT recipe_id, tag FROM tags '
+                'ORDER BY recipe_id, position'):
+            tags.setdefault(row[0], []).append(row[1])
+
+        notes = {}
+        for row in cur.execute('SELECT recipe_id, date, text FROM notes '
+                'ORDER BY recipe_id, position'):
+            notes.setdefault(row[0], []).append(
+                (datetime.strptime(row[1], '%Y-%m-%d'), row[2]))
+
+        recipes = []
+        for recipe_id, title, instructions in cur.execute(
+                'SELECT id, title, instructions FROM recipes ORDER BY id'):
+            recipes.append(Recipe(title, ingredients.get(recipe_id, []),
+                instructions, tags=tags.get(recipe_id),
+                notes=notes.get(recipe_id)))
+        return recipes
+
+    def save(self, recipe):
+        '''
+        Saves one recipe, replacing any older version of it.
+        '''
+        self.save_many([recipe])
+
+    @_locked
+    def save_many(self, recipes):
+        '''
+        Saves a batch of recipes in a single transaction, so either all of
+        them are saved or none are.
+        '''
+        with self.connection:
+            for rec in recipes:
+                self._save(rec)
+
+    @_locked
+    def delete(self, title):
+        '''
+        Removes a recipe from the database.
+        '''
+        with self.connection:
+            row = self.connection.execute(
+                'SELECT id FROM recipes WHERE title = ?', (title,)).fetchone()
+            if row is None:
+                return
+            if self.has_fts:
+                self.connection.execute(
+                    'DELETE FROM recipes_search WHERE rowid = ?', row)
+            self.connection.execute('DELETE FROM recipes WHERE id = ?', row)
+
+    @_locked
+    def close(self):
+        self.connection.close()
+
+    def needs_saving(self):
+        return []
+
+    @_locked
+    def search(self, text):
+        '''
+        Finds the recipes whose title, ingredient names or tags contain some
+        text, ignoring case, using the full text search index. The index is
+        made of trigrams, so it can only search for text of 3 or more
+        characters; shorter text (or any text, if the index isn't available)
+        has to be searched for some other way, like Cookbook.find does.
+
+        Args:
+            text (str): text to search for
+
+        Returns:
+            titles (list or None): titles of the matching recipes, or None if
+                the text can't be searched for with the index
+        '''
+        if not self.has_fts or len(text) < 3:
+            return None
+        # quoted, so the text is matched as a phrase rather than as a query
+        phrase = '"' + text.replace('"', '""') + '"'
+        rows = self.connection.execute('SELECT title FROM recipes_search '
+            'WHERE recipes_search MATCH ?', (phrase,))
+        return [row[0] for row in rows]
+
+    def _save(self, recipe):
+        cur = self.connection.cursor()
+        row = cur.execute('SELECT id FROM recipes WHERE title = ?',
+            (recipe.title,)).fetchone()
+        if row is None:
+            cur.execute('INSERT INTO recipes (title, instructions) '
+                'VALUES (?, ?)', (recipe.title, recipe.instructions))
+            recipe_id = cur.lastrowid
+        else:
+            recipe_id = row[0]
+            cur.execute('UPDATE recipes SET instructions = ? WHERE id = ?',
+                (recipe.instructions, recipe_id))
+            for table in ('ingredients', 'tags', 'notes'):
+                cur.execute(f'DELETE FROM {table} WHERE recipe_id = ?',
+                    (recipe_id,))
+            if self.has_fts:
+                cur.execute('DELETE FROM recipes_search WHERE rowid = ?',
+                    (recipe_id,))
+
+        cur.executemany('INSERT INTO ingredients (recipe_id, position, number, '
+            'unit, name, normalised_name) VALUES (?, ?, ?, ?, ?, ?)',
+            [(recipe_id, pos, ing[0], ing[1], ing[2],
+                Recipe.normalise_name(ing[2]))
+                for pos, ing in enumerate(recipe.ingredients)])
+        cur.executemany('INSERT INTO tags (recipe_id, position, tag) '
+            'VALUES (?, ?, ?)',
+            [(recipe_id, pos, tag) for pos, tag in enumerate(recipe.tags)])
+        cur.executemany('INSERT INTO notes (recipe_id, position, date, text) '
+            'VALUES (?, ?, ?, ?)',
+            [(recipe_id, pos, note[0].strftime('%Y-%m-%d'),
+                note[1] if len(note) > 1 else '')
+                for pos, note in enumerate(recipe.notes)])
+
+        if self.has_fts:
+            cur.execute('INSERT INTO recipes_search (rowid, title, '
+                'ingredients, tags) VALUES (?, ?, ?, ?)',
+                (recipe_id, recipe.title,
+                '\n'.join(ing[2] for ing in recipe.ingredients),
+                '\n'.join(recipe.tags)))
+
+
+def open_storage(location):
+    '''
+    Opens the storage at a location, choosing the backend from its name:
+    paths ending in .db are SQLite databases, anything else is a directory
+    of text files.
+    '''
+    if location.endswith('.db'):
+        return SQLiteStorage(location)
+    return TextFileStorage(location)
+
+def convert(source, destination, batch_size=1000):
+    '''
+    Copies every recipe from one storage backend to another, saving them in
+    batches.
+
+    Args:
+        source: storage to read recipes from
+        destination: storage to write recipes to
+        batch_size (int): number of recipes saved per batch (i.e. per
+            transaction, for SQLite)
+
+    Returns:
+        count (int): number of recipes copied
+    '''
+    recipes = source.load()
+    for start in range(0, len(recipes), batch_size):
+        destination.save_many(recipes[start:start+batch_size])
+    return len(recipes)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Convert a cookbook between text files and SQLite.')
+    arg_parser.add_argument('direction', choices=['to-sqlite', 'to-text'])
+    arg_parser.add_argument('source',
+        help='recipes directory (to-sqlite) or database file (to-text)')
+    arg_parser.add_argument('destination',
+        help='database file (to-sqlite) or recipes directory (to-text)')
+    args = arg_parser.parse_args()
+
+    if args.direction == 'to-sqlite':
+        source = TextFileStorage(args.source)
+        destination = SQLiteStorage(args.destination)
+    else:
+        source = SQLiteStorage(args.source)
+        destination = TextFileStorage(args.destination)
+
+    copied = convert(source, destination)
+    source.close()
+    destination.close()
+    print(f'Copied {copied} recipes from {args.source} to {args.destination}.')
@@ -0,0 +1,129 @@
+import re
+
+class TagIndex:
+    '''
+    Index from tags to the recipes which have them, used to filter a cookbook
+    by tag. Each recipe is given an integer id by the cookbook, and each tag
+    maps to a bitset (stored as a python int) with bit <id> set for every
+    recipe with that tag, so that combining tags is just a few bitwise
+    operations.
+
+    Attributes:
+        bitsets (dict): maps each (normalised) tag to the bitset of recipes
+            with that tag
+        counts (dict): maps each tag to the number of recipes with that tag
+        all (int): bitset of every recipe in the index, tagged or not
+    '''
+    def __init__(self):
+        self.bitsets = {}
+        self.counts = {}
+        self.all = 0
+
+    @staticmethod
+    def normalise(tag):
+        '''
+        Returns the form of a tag used as a key in the index, so that tags
+        match regardless of capitalization or stray whitespace.
+        '''
+        return ' '.join(tag.split()).lower()
+
+    def add(self, recipe_id, tags):
+        '''
+        Adds a recipe to the index.
+
+        Args:
+            recipe_id (int): id of the recipe to add
+            tags (list): list of the recipe's tags
+        '''
+        bit = 1 << recipe_id
+        self.all |= bit
+        for tag in self._tag_keys(tags):
+            self.bitsets[tag] = self.bitsets.get(tag, 0) | bit
+            self.counts[tag] = self.counts.get(tag, 0) + 1
+
+    def remove(self, recipe_id, tags):
+        '''
+        Removes a recipe from the index. Tags should be the same ones the
+        recipe was added with.
+
+        Args:
+            recipe_id (int): id of the recipe to remove
+            tags (list): list of the recipe's tags
+        '''
+        bit = 1 << recipe_id
+        self.all &= ~bit
+        for tag in self._tag_keys(tags):
+            if not self.bitsets.get(tag, 0) & bit:
+                continue
+            self.counts[tag] -= 1
+            if self.counts[tag]:
+                self.bitsets[tag] &= ~bit
+            else:
+                del self.bitsets[tag]
+                del self.counts[tag]
+
+    def query(self, query):
+        '''
+        Evaluates a tag query and returns the bitset of recipes matching it.
+        Queries are tags joined by the (uppercase) operators AND, OR and NOT,
+        like "dinner AND vegetarian NOT spicy". NOT means "and not", and AND
+        binds tighter than OR. Tags may contain spaces. An empty query matches
+        every recipe.
+
+        Args:
+            query (str): query string to evaluate
+
+        Returns:
+            bits (int): bitset of the ids of matching recipes
+        '''
+        tokens = [t.strip() for t in re.split(r'\b(AND|OR|NOT)\b', query)]
+        tokens = [t for t in tokens if t]
+        if not tokens:
+            return self.all
+
+        # the result is an OR of groups, where each group is the AND of the
+        # tags (and NOT tags) in it
+        result = 0
+        group = self.all
+        group_has_terms = False
+        negate = False
+        for token in tokens:
+            if token == 'OR':
+                if group_has_terms:
+                    result |= group
+                group = self.all
+                group_has_terms = False
+                negate = False
+            elif token == 'NOT':
+                negate = True
+            elif token == 'AND':
+                continue
+            else:
+                bits = self.bitsets.get(TagIndex.normalise(token), 0)
+                if negate:
+                    group &= ~bits
+                else:
+                    group &= bits
+                group_has_terms = True
+                negate = False
+
+        if group_has_terms:
+            result |= group
+        return result
+
+    @staticmethod
+    def ids(bits):
+        '''
+        Returns a list of the ids whose bits are set in a bitset, in
+        increasing order.
+        '''
+        # scanning the binary string is done in C, so this only does python
+        # work for the bits that are actually set
+        reversed_bits = bin(bits)[:1:-1]
+        return [m.start() for m in re.finditer('1', reversed_bits)]
+
+    @staticmethod
+    def _tag_keys(tags):
+        keys = {TagIndex.normalise(tag) for tag in tags}
+        keys.discard('')
+        return keys
@@ -0,0 +1,468 @@
+'''
+Imports recipes from web pages that have been saved to disk, so that it works
+without an internet connection. Recipe data is read from the schema.org
+Recipe markup most recipe sites include, either as JSON-LD or as microdata.
+
+Pages are parsed in a pool of worker processes. Only a bounded number of pages
+are queued at any time, so directories with thousands of pages are streamed
+through the pool instead of all being loaded at once. A page that can't be
+imported is reported, and the rest of the batch carries on.
+
+Usage:
+    python web_import.py <directory of saved pages> [--out Recipes]
+'''
+from recipe import Recipe
+from storage import TextFileStorage
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+import html
+import json
+import logging
+import os
+import re
+import argparse
+
+# result of importing one page. exactly one of recipe and error is None.
+ImportResult = namedtuple('ImportResult', ['path', 'recipe', 'error'])
+
+PAGE_EXTENSIONS = ('.html', '.htm', '.xhtml')
+
+# microdata properties of a schema.org Recipe that are used by the importer
+RECIPE_PROPERTIES = {'name', 'recipeIngredient', 'ingredients',
+    'recipeInstructions', 'keywords', 'recipeCategory', 'recipeCuisine'}
+
+# elements which never have a closing tag
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+# elements that start a new line in text captured from the page
+LINE_ELEMENTS = {'br', 'p', 'li', 'div', 'tr', 'h1', 'h2', 'h3', 'h4'}
+
+class RecipePageParser(HTMLParser):
+    '''
+    Collects the schema.org Recipe data from an html page in a single pass.
+
+    Attributes:
+        json_ld (list): text of every <script type="application/ld+json">
+            block in the page
+        microdata (dict): maps each Recipe property found in microdata to the
+            list of its values, in the order they appear in the page
+    '''
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_ld = []
+        self.microdata = {}
+
+        self._json_buffer = None
+        # each open element is [tag, opens_scope, property, text buffer]
+        self._elements = []
+        # for each open itemscope, whether it is a Recipe
+        self._scopes = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+
+        if tag == 'script' and 'ld+json' in (attrs.get('type') or ''):
+            self._json_buffer = []
+
+        if tag in LINE_ELEMENTS:
+            self._capture_text('\n')
+
+        in_recipe = bool(self._scopes) and self._scopes[-1]
+        prop = attrs.get('itemprop') if in_recipe else None
+        if prop not in RECIPE_PROPERTIES:
+            prop = None
+
+        if prop and attrs.get('content') is not None:
+            self._add_property(prop, attrs['content'])
+            prop = None
+        if tag in VOID_ELEMENTS:
+            return
+
+        opens_scope = 'itemscope' in attrs
+        if opens_scope:
+            itemtype = attrs.get('itemtype') or ''
+            self._scopes.append(re.search(r'schema\.org/Recipe\b', itemtype)
+                is not None)
+
+        self._elements.append([tag, opens_scope, prop, [] if prop else None])
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in VOID_ELEMENTS:
+            # self closing tags like <div/> don't leave anything open
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+        else:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self._json_buffer is not None:
+            self.json_ld.append(''.join(self._json_buffer))
+            self._json_buffer = None
+
+        # find the matching open element. anything opened inside it that
+        # wasn't closed is closed along with it.
+        for idx in range(len(self._elements) - 1, -1, -1):
+            if self._elements[idx][0] == tag:
+                break
+        else:
+            return
+
+        while len(self._elements) > idx:
+            _, opens_scope, prop, buffer = self._elements.pop()
+            if opens_scope:
+                self._scopes.pop()
+            if prop:
+                self._add_property(prop, ''.join(buffer))
+
+    def handle_data(self, data):
+        if self._json_buffer is not None:
+            self._json_buffer.append(data)
+        else:
+            self._capture_text(data)
+
+    def _capture_text(self, text):
+        for element in self._elements:
+            if element[3] is not None:
+                element[3].append(text)
+
+    def _add_property(self, prop, value):
+        self.microdata.setdefault(prop, []).append(value)
+
+
+def _clean_text(text, single_line=False):
+    '''
+    Strips html tags and entities out of a string from a page, and tidies up
+    its whitespace. Line breaks are kept unless single_line is True.
+    '''
+    block_tags = '|'.join(LINE_ELEMENTS)
+    text = re.sub(rf'<(/?)({block_tags})\b[^>]*>', '\n', text, flags=re.I)
+    text = html.unescape(re.sub(r'<[^>]*>', '', text))
+    if single_line:
+        return ' '.join(text.split())
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def _is_recipe(node):
+    return isinstance(node, dict) and 'Recipe' in _as_list(node.get('@type'))
+
+def _find_json_ld_recipe(node):
+    '''
+    Searches a parsed JSON-LD document (which may be a list, or have an
+    @graph) for the first object with @type Recipe.
+    '''
+    if _is_recipe(node):
+        return node
+    if isinstance(node, dict):
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_json_ld_recipe(child)
+        if found:
+            return found
+    return None
+
+def _instruction_lines(value):
+    '''
+    Flattens recipeInstructions, which can be a string, a list of strings, or
+    a list of HowToStep and HowToSection objects, into a list of lines.
+    '''
+    lines = []
+    for item in _as_list(value):
+        if isinstance(item, str):
+            lines.append(_clean_text(item))
+        elif isinstance(item, dict):
+            if 'itemListElement' in item:
+                if item.get('name'):
+                    lines.append(_clean_text(str(item['name'])) + ':')
+                lines += _instruction_lines(item['itemListElement'])
+            elif item.get('text') or item.get('name'):
+                lines.append(_clean_text(str(item.get('text') or item['name'])))
+    return [line for line in lines if line]
+
+def _tag_list(*values):
+    tags = []
+    for value in values:
+        for item in _as_list(value):
+            if not isinstance(item, str):
+                continue
+            for tag in item.split(','):
+                tag = _clean_text(tag, single_line=True)
+                if tag and tag.lower() not in [t.lower() for t in tags]:
+                    tags.append(tag)
+    return tags
+
+def extract_recipe_data(page_html):
+    '''
+    Reads the schema.org Recipe data out of an html page. JSON-LD is used if
+    the page has it, otherwise microdata.
+
+    Args:
+        page_html (str): text of the page
+
+    Returns:
+        data (dict or None): dictionary with keys 'title' (str),
+            'ingredients' (list of str, one per ingredient), 'instructions'
+            (str) and 'tags' (list of str), or None if the page doesn't
+            contain a recipe
+    '''
+    parser = RecipePageParser()
+    parser.feed(page_html)
+    parser.close()
+
+    for block in parser.json_ld:
+        try:
+            recipe = _find_json_ld_recipe(json.loads(block, strict=False))
+        except ValueError:
+            continue
+        if recipe and recipe.get('name'):
+            ingredients = recipe.get('recipeIngredient',
+                recipe.get('ingredients'))
+            return {
+                'title': _clean_text(str(recipe['name']), single_line=True),
+                'ingredients': [_clean_text(str(i), single_line=True)
+                    for i in _as_list(ingredients)],
+                'instructions': '\n'.join(
+                    _instruction_lines(recipe.get('recipeInstructions'))),
+                'tags': _tag_list(recipe.get('keywords'),
+                    recipe.get('recipeCategory'), recipe.get('recipeCuisine')),
+            }
+
+    data = parser.microdata
+    if data.get('name'):
+        ingredients = data.get('recipeIngredient', data.get('ingredients', []))
+        return {
+            'title': _clean_text(data['name'][0], single_line=True),
+            'ingredients': [_clean_text(i, single_line=True)
+                for i in ingredients],
+            'instructions': '\n'.join(
+                _instruction_lines(data.get('recipeInstructions'))),
+            'tags': _tag_list(data.get('keywords'), data.get('recipeCategory'),
+                data.get('recipeCuisine')),
+        }
+
+    return None
+
+def recipe_from_page(path):
+    '''
+    Reads a saved web page and builds a Recipe object from the recipe in it.
+    Raises ValueError if the page doesn't contain a recipe.
+
+    Args:
+        path (str): path to the saved html page
+
+    Returns:
+        recipe (Recipe): recipe from the page
+    '''
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        data = extract_recipe_data(f.read())
+
+    if data is None or not data['title']:
+        raise ValueError('no schema.org Recipe found in page')
+
+    ingredients = '\n'.join(_ingredient_line(line)
+        for line in data['ingredients'] if line)
+
+    return Recipe(data['title'], ingredients, data['instructions'],
+        tags=data['tags'])
+
+def _ingredient_line(line):
+    '''
+    Tidies up an ingredient line from a page for Recipe.parse_ingredients,
+    which treats commas as separators between ingredients. On websites,
+    anything after the first comma is usually how the ingredient is prepared
+    (e.g. "1 onion, chopped"), so it is put in parentheses, which
+    Recipe.normalise_name ignores, and any further commas are swapped out.
+    '''
+    line, _, preparation = line.partition(',')
+    preparation = preparation.strip().replace(',', ';')
+    if preparation:
+        line = f'{line.strip()} ({preparation})'
+    return line.strip()
+
+def _page_paths(directory):
+    # scandir is lazy, so huge directories aren't listed all at once
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(PAGE_EXTENSIONS):
+                yield entry.path
+
+def import_pages(directory, workers=None, max_pending=None):
+    '''
+    Parses every saved web page in a directory into a Recipe, using a pool of
+    worker processes. Results are yielded as soon as each page is done, so
+    they don't come out in any particular order.
+
+    Args:
+        directory (str): directory containing the saved pages (.html, .htm or
+            .xhtml files)
+        workers (int or None): number of worker processes. Defaults to the
+            number of cpus.
+        max_pending (int or None): most pages that can be queued or in
+            progress at once. Defaults to four per worker.
+
+    Yields:
+        result (ImportResult): (path, recipe, error) for each page. If the
+            page couldn't be imported, recipe is None and error is a string
+            describing why.
+
+    If a worker process dies (i.e. it crashes or runs out of memory), the
+    pages it and the other workers were working on are reported as failed,
+    and the rest are imported by a new pool of workers.
+    '''
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # maps each future to the page it is importing and the pool it was
+        # sent to
+        pending = {}
+        paths = _page_paths(directory)
+        paths_left = True
+
+        while paths_left or pending:
+            while paths_left and len(pending) < max_pending:
+                path = next(paths, None)
+                if path is None:
+                    paths_left = False
+                    break
+                try:
+                    future = pool.submit(recipe_from_page, path)
+                except BrokenProcessPool:
+                    # the pool broke since results were last collected. the
+                    # pages already sent to it fail, and are reported below
+                    pool = _replace_pool(pool, workers)
+                    future = pool.submit(recipe_from_page, path)
+                pending[future] = (path, pool)
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, sent_to = pending.pop(future)
+                try:
+                    recipe = future.result()
+                except BrokenProcessPool as e:
+                    yield ImportResult(path, None, f'{type(e).__name__}: {e}')
+                    if sent_to is pool:
+                        pool = _replace_pool(pool, workers)
+                    continue
+                except Exception as e:
+                    yield ImportResult(path, None, f'{type(e).__name__}: {e}')
+                    continue
+                # version numbers came from the worker process's counter, so
+                # give the recipe a fresh one from this process
+                recipe.mark_changed()
+                yield ImportResult(path, recipe, None)
+    finally:
+        pool.shutdown()
+
+def _replace_pool(pool, workers):
+    # shuts down a pool whose workers have died, and starts a new one
+    logging.warning("A worker process died, starting new workers")
+    pool.shutdown(wait=False)
+    return ProcessPoolExecutor(max_workers=workers)
+
+def import_directory(directory, save_directory='Recipes', workers=None,
+        max_pending=None, batch_size=100):
+    '''
+    Imports every saved web page in a directory and saves the recipes in
+    them to a recipes directory (see TextFileStorage). Recipes whose title is
+    already taken, either by an existing recipe or an earlier page in the
+    batch, are skipped and reported as failures.
+
+    Args:
+        directory (str): directory containing the saved pages
+        save_directory (str): directory to save recipe files to, relative to
+            the directory containing this file
+        workers (int or None): see import_pages
+        max_pending (int or None): see import_pages
+        batch_size (int): number of recipes saved at once
+
+    Returns:
+        imported (list): list of the Recipe objects that were saved
+        failures (list): list of ImportResult tuples for the pages that
+            couldn't be imported
+    '''
+    imported = []
+    failures = []
+    storage = TextFileStorage(save_directory)
+    try:
+        titles = {recipe.title for recipe in storage.load()}
+        batch = []
+        for result in import_pages(directory, workers=workers,
+                max_pending=max_pending):
+            if result.error is None and result.recipe.title in titles:
+                result = ImportResult(result.path, None, 'ValueError: a '
+                    f'recipe titled "{result.recipe.title}" already exists')
+            if result.error is not None:
+                logging.warning(f"Could not import {result.path}: "
+                    f"{result.error}")
+                failures.append(result)
+                continue
+
+            titles.add(result.recipe.title)
+            batch.append(result)
+            if len(batch) >= batch_size:
+                _save_batch(storage, batch, imported, failures)
+                batch = []
+        _save_batch(storage, batch, imported, failures)
+    finally:
+        storage.close()
+
+    return imported, failures
+
+def _save_batch(storage, results, imported, failures):
+    # saves the recipes from a batch of imported pages, adding them to
+    # imported. if the batch can't be saved together, they are saved one at a
+    # time, so that one bad recipe doesn't stop the rest from being saved.
+    if not results:
+        return
+    try:
+        storage.save_many([result.recipe for result in results])
+    except Exception:
+        pass
+    else:
+        imported += [result.recipe for result in results]
+        return
+
+    for result in results:
+        try:
+            storage.save(result.recipe)
+        except Exception as e:
+            result = ImportResult(result.path, None, f'{type(e).__name__}: {e}')
+            logging.warning(f"Could not import {result.path}: {result.error}")
+            failures.append(result)
+        else:
+            imported.append(result.recipe)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Import recipes from saved web pages.')
+    arg_parser.add_argument('directory',
+        help='directory containing saved .html pages')
+    arg_parser.add_argument('--out', default='Recipes',
+        help='directory to save recipe files to (default: Recipes)')
+    arg_parser.add_argument('--workers', type=int, default=None,
+        help='number of worker processes (default: number of cpus)')
+    args = arg_parser.parse_args()
+
+    imported, failures = import_directory(args.directory,
+        save_directory=args.out, workers=args.workers)
+    print(f'Imported {len(imported)} recipes, {len(failures)} failed.')
+    for failure in failures:
+        print(f'{failure.path}: {failure.error}')